@@ -1,13 +1,17 @@
 import os
 import json
+import base64
+import logging
 import sqlite3
-import openai
-from flask import Flask, redirect, request, jsonify, render_template_string
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
+import threading
+from flask import Flask, Response, redirect, request, jsonify, stream_template, stream_with_context
 from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
+from gmail_connect import get_rules_store, apply_label, fetch_headers, LabelResolver
+from rule_store import match_compiled
+from pipeline import Pipeline, Stage
+from gmail_http import gmail_service, account_service, forget_account_service
+from run_journal import recent_runs
 
 load_dotenv()
 
@@ -16,10 +20,19 @@ app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1)
 
 SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
 DB_PATH = "labeled_emails.db"
+FETCH_WORKERS = 8
+CLASSIFY_WORKERS = 4
+APPLY_WORKERS = 4
+DEFAULT_PAGE_SIZE = 5
+MAX_PAGE_SIZE = 100
 
 credentials_json = os.getenv("GOOGLE_CREDENTIALS_JSON")
 redirect_uri = os.getenv("REDIRECT_URI")
-openai.api_key = os.getenv("OPENAI_API_KEY")
+openai_api_key = os.getenv("OPENAI_API_KEY")
+pubsub_topic = os.getenv("PUBSUB_TOPIC")  # e.g. projects/<project>/topics/gmail-push
+push_token = os.getenv("PUSH_VERIFICATION_TOKEN")
+_account_locks = {}
+_account_locks_guard = threading.Lock()
 
 if not credentials_json:
     raise ValueError("Missing GOOGLE_CREDENTIALS_JSON env variable")
@@ -27,7 +40,26 @@ if not redirect_uri:
     raise ValueError("Missing REDIRECT_URI environment variable")
 
 credentials_dict = json.loads(credentials_json)
-flow = Flow.from_client_config(credentials_dict, scopes=SCOPES, redirect_uri=redirect_uri)
+
+# Heavy client libraries (OAuth flow, openai, googleapiclient) are imported on first
+# use so routes that don't need them, and short scheduled runs, don't pay for them
+_flow = None
+_openai = None
+
+def get_flow():
+    global _flow
+    if _flow is None:
+        from google_auth_oauthlib.flow import Flow
+        _flow = Flow.from_client_config(credentials_dict, scopes=SCOPES, redirect_uri=redirect_uri)
+    return _flow
+
+def get_openai():
+    global _openai
+    if _openai is None:
+        import openai
+        openai.api_key = openai_api_key
+        _openai = openai
+    return _openai
 
 # --- Helper functions to store/load credentials ---
 def save_user_token(email, creds):
@@ -52,26 +84,122 @@ def load_user_token(email):
     row = c.fetchone()
     conn.close()
     if row:
+        from google.oauth2.credentials import Credentials
         data = json.loads(row[0])
         return Credentials(**data)
     return None
 
+def save_history_id(email, history_id, expiration=None):
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    if expiration is None:
+        # Only move forward, so a slower concurrent notification can't rewind the stored ID
+        c.execute("INSERT OR IGNORE INTO watch_state (email, history_id) VALUES (?, ?)", (email, str(history_id)))
+        c.execute("UPDATE watch_state SET history_id = ? WHERE email = ? AND CAST(history_id AS INTEGER) < ?",
+                  (str(history_id), email, int(history_id)))
+    else:
+        # Watch renewal: keep an existing history ID so a delta that hasn't been processed
+        # yet (e.g. after a failed push) isn't skipped; only the first watch sets it
+        c.execute("INSERT OR IGNORE INTO watch_state (email, history_id, expiration) VALUES (?, ?, ?)",
+                  (email, str(history_id), str(expiration)))
+        c.execute("UPDATE watch_state SET expiration = ? WHERE email = ?", (str(expiration), email))
+    conn.commit()
+    conn.close()
+
+def load_history_id(email):
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute("SELECT history_id FROM watch_state WHERE email = ?", (email,))
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def list_new_inbox_ids(service, start_history_id):
+    # Walk the history delta and collect messages that landed in the inbox
+    msg_ids = []
+    seen = set()
+    latest_history_id = start_history_id
+    page_token = None
+    while True:
+        results = service.users().history().list(
+            userId='me',
+            startHistoryId=start_history_id,
+            historyTypes=['messageAdded'],
+            labelId='INBOX',
+            pageToken=page_token
+        ).execute()
+        for record in results.get('history', []):
+            for added in record.get('messagesAdded', []):
+                msg = added['message']
+                if 'INBOX' in msg.get('labelIds', []) and msg['id'] not in seen:
+                    seen.add(msg['id'])
+                    msg_ids.append(msg['id'])
+        latest_history_id = results.get('historyId', latest_history_id)
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+    return msg_ids, latest_history_id
+
+def open_db():
+    return sqlite3.connect(DB_PATH)
+
+def close_db(conn):
+    conn.commit()
+    conn.close()
+
+def label_new_messages(service, msg_ids):
+    # service must be thread safe (see gmail_http); fetch and apply share it across workers.
+    # Returns (labeled, failed): a message that couldn't be fetched, classified or
+    # labeled counts as failed, so the caller can leave the history delta to be replayed.
+    compiled_rules = get_rules_store().compiled()
+    labels = LabelResolver(service)
+
+    def fetch(msg_id):
+        return (msg_id,) + fetch_headers(service, msg_id)
+
+    def classify(item):
+        msg_id, msg_from, msg_subject = item
+        label_name = match_compiled(compiled_rules, msg_from, msg_subject)
+        # Resolved here, on the single classify worker, so apply only calls messages.modify
+        return (msg_id, label_name, labels.label_id(label_name)) if label_name else None
+
+    def apply(item):
+        msg_id, label_name, label_id = item
+        if not apply_label(service, 'me', msg_id, label_name, label_id):
+            raise RuntimeError(f"could not label {msg_id} as {label_name}")
+        return msg_id
+
+    pipeline = Pipeline([
+        Stage('fetch', fetch, workers=FETCH_WORKERS),
+        Stage('classify', classify),
+        Stage('apply', apply, workers=APPLY_WORKERS),
+    ])
+    labeled = len(pipeline.run(msg_ids))
+    failed = sum(stats['errors'] for stats in pipeline.stats.values())
+    return labeled, failed
+
 # --- Routes ---
 @app.route('/')
 def index():
-    auth_url, _ = flow.authorization_url(prompt='consent', access_type='offline', include_granted_scopes='true')
+    auth_url, _ = get_flow().authorization_url(prompt='consent', access_type='offline', include_granted_scopes='true')
     return redirect(auth_url)
 
 @app.route('/oauth2callback')
 def oauth2callback():
+    flow = get_flow()
     flow.fetch_token(authorization_response=request.url)
     creds = flow.credentials
     try:
-        service = build('gmail', 'v1', credentials=creds)
-        profile = service.users().getProfile(userId='me').execute()
+        service = gmail_service(creds)
+        try:
+            profile = service.users().getProfile(userId='me').execute()
+        finally:
+            service.close()
         email_address = profile['emailAddress']
 
         save_user_token(email_address, creds)
+        # The cached service (if any) still holds the old grant
+        forget_account_service(email_address)
 
         return jsonify({'status': 'OAuth success!', 'email': email_address})
     except Exception as e:
@@ -96,10 +224,110 @@ def setup_db():
             token TEXT
         )
     ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS watch_state (
+            email TEXT PRIMARY KEY,
+            history_id TEXT,
+            expiration TEXT
+        )
+    ''')
     conn.commit()
     conn.close()
     return "Database and tables created successfully."
 
+@app.route('/watch-all')
+def watch_all():
+    # Gmail watches expire after 7 days, so this should be re-run daily (e.g. from a scheduler)
+    if not pubsub_topic:
+        return "Missing PUBSUB_TOPIC environment variable", 500
+
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute("SELECT email FROM user_tokens")
+    emails = [row[0] for row in c.fetchall()]
+    conn.close()
+
+    watched = []
+    failed = {}
+    for email in emails:
+        creds = load_user_token(email)
+        try:
+            service = account_service(email, creds)
+            response = service.users().watch(userId='me', body={
+                'topicName': pubsub_topic,
+                'labelIds': ['INBOX'],
+                'labelFilterBehavior': 'include'
+            }).execute()
+            save_history_id(email, response['historyId'], response.get('expiration'))
+            watched.append(email)
+        except Exception as e:
+            failed[email] = str(e)
+
+    return jsonify({'status': 'Watch registered', 'watched': watched, 'failed': failed})
+
+def account_lock(email):
+    with _account_locks_guard:
+        return _account_locks.setdefault(email, threading.Lock())
+
+@app.route('/gmail-push', methods=['POST'])
+def gmail_push():
+    # Fail closed: without a shared token anyone could trigger Gmail work for a stored account
+    if not push_token:
+        return "Missing PUSH_VERIFICATION_TOKEN environment variable", 500
+    if request.args.get('token') != push_token:
+        return "Invalid push token", 403
+
+    # Pub/Sub redelivers anything that isn't a 2xx, so malformed messages are acked and logged
+    envelope = request.get_json(silent=True) or {}
+    try:
+        data = json.loads(base64.b64decode(envelope['message']['data']))
+        user_email = data['emailAddress']
+        notified_history_id = str(int(data['historyId']))
+    except (KeyError, TypeError, ValueError) as e:
+        logging.error(f"❌ Dropping malformed Pub/Sub message: {e}")
+        return "", 204
+
+    creds = load_user_token(user_email)
+    if not creds:
+        return "", 204
+
+    # Notifications for one account are handled one at a time so they don't read the
+    # same history delta and label the same messages twice
+    with account_lock(user_email):
+        return process_push(user_email, creds, notified_history_id)
+
+def process_push(user_email, creds, notified_history_id):
+    start_history_id = load_history_id(user_email)
+    if not start_history_id:
+        save_history_id(user_email, notified_history_id)
+        return "", 204
+
+    from googleapiclient.errors import HttpError
+
+    service = account_service(user_email, creds)
+    try:
+        msg_ids, latest_history_id = list_new_inbox_ids(service, start_history_id)
+    except HttpError as e:
+        if e.resp.status == 404:
+            # Stored history ID is too old; start over from this notification
+            save_history_id(user_email, notified_history_id)
+            return "", 204
+        raise
+
+    labeled, failed = label_new_messages(service, msg_ids)
+    if failed:
+        # Keep the stored history ID and answer non-2xx so Pub/Sub redelivers and the
+        # same delta is replayed; relabeling the messages that did succeed is harmless
+        logging.error(f"❌ {failed} of {len(msg_ids)} new message(s) for {user_email} failed; history ID left at {start_history_id}")
+        return jsonify({'status': 'Push failed', 'email': user_email, 'messages': len(msg_ids), 'labeled': labeled, 'failed': failed}), 500
+    save_history_id(user_email, latest_history_id)
+    return jsonify({'status': 'Processed push', 'email': user_email, 'messages': len(msg_ids), 'labeled': labeled})
+
+@app.route('/run-progress')
+def run_progress():
+    # Progress of recent organizer runs recorded in the run journal
+    return jsonify({'runs': recent_runs()})
+
 @app.route('/fetch-labeled-emails')
 def fetch_labeled_emails():
     user_email = request.args.get("email")
@@ -107,69 +335,76 @@ def fetch_labeled_emails():
     if not creds:
         return "User not authenticated", 401
 
-    service = build('gmail', 'v1', credentials=creds)
+    service = account_service(user_email, creds)
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("CREATE TABLE IF NOT EXISTS labeled_emails (id INTEGER PRIMARY KEY AUTOINCREMENT, user_email TEXT, sender TEXT, subject TEXT, label TEXT)")
+    conn = open_db()
+    conn.execute("CREATE TABLE IF NOT EXISTS labeled_emails (id INTEGER PRIMARY KEY AUTOINCREMENT, user_email TEXT, sender TEXT, subject TEXT, label TEXT)")
+    close_db(conn)
 
     labels = service.users().labels().list(userId='me').execute().get('labels', [])
     custom_labels = [label for label in labels if label['type'] != 'system']
 
-    total_added = 0
-    for label in custom_labels:
+    def list_ids(label):
         results = service.users().messages().list(userId='me', labelIds=[label['id']], maxResults=10).execute()
-        messages = results.get('messages', [])
-
-        for msg in messages:
-            msg_detail = service.users().messages().get(userId='me', id=msg['id'], format='metadata', metadataHeaders=['From', 'Subject']).execute()
-            headers = msg_detail.get('payload', {}).get('headers', [])
-            msg_from = next((h['value'] for h in headers if h['name'] == 'From'), '')
-            msg_subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '')
-
-            c.execute("SELECT 1 FROM labeled_emails WHERE user_email=? AND sender=? AND subject=? AND label=?",
-                      (user_email, msg_from, msg_subject, label['name']))
-            if not c.fetchone():
-                c.execute("INSERT INTO labeled_emails (user_email, sender, subject, label) VALUES (?, ?, ?, ?)",
-                          (user_email, msg_from, msg_subject, label['name']))
-                total_added += 1
-
-    conn.commit()
-    conn.close()
+        return [(label['name'], msg['id']) for msg in results.get('messages', [])]
+
+    def fetch(item):
+        label_name, msg_id = item
+        return fetch_headers(service, msg_id) + (label_name,)
+
+    def persist(conn, item):
+        msg_from, msg_subject, label_name = item
+        c = conn.cursor()
+        c.execute("SELECT 1 FROM labeled_emails WHERE user_email=? AND sender=? AND subject=? AND label=?",
+                  (user_email, msg_from, msg_subject, label_name))
+        if not c.fetchone():
+            c.execute("INSERT INTO labeled_emails (user_email, sender, subject, label) VALUES (?, ?, ?, ?)",
+                      (user_email, msg_from, msg_subject, label_name))
+            return 1
+        return None
+
+    pipeline = Pipeline([
+        Stage('list', list_ids, workers=2, fan_out=True),
+        Stage('fetch', fetch, workers=FETCH_WORKERS),
+        Stage('persist', persist, setup=open_db, teardown=close_db),
+    ])
+    total_added = len(pipeline.run(custom_labels))
     return jsonify({'status': 'Fetched labeled emails', 'count': total_added})
 
-@app.route('/suggest-labels')
-def suggest_labels():
-    user_email = request.args.get("email")
-    creds = load_user_token(user_email)
-    if not creds:
-        return "User not authenticated", 401
+def parse_page_size():
+    try:
+        page_size = int(request.args.get("page_size", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        page_size = DEFAULT_PAGE_SIZE
+    return max(1, min(page_size, MAX_PAGE_SIZE))
 
-    service = build('gmail', 'v1', credentials=creds)
+def suggestion_stream(creds, user_email, cursor, page_size):
+    # Lists one page of the inbox up front (for the next cursor) and returns a generator
+    # that yields each suggestion as soon as its classification finishes
+    service = account_service(user_email, creds)
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = open_db()
     c = conn.cursor()
     c.execute("SELECT sender, subject, label FROM labeled_emails WHERE user_email=? LIMIT 20", (user_email,))
     training_examples = c.fetchall()
+    conn.close()
+
+    example_lines = [f'Sender: {s}\nSubject: {subj}\nLabel: {lbl}' for s, subj, lbl in training_examples]
+    prompt_prefix = "You are an email labeling assistant. Based on the following examples, suggest a label:\n\n"
+    prompt_prefix += "\n\n".join(example_lines)
 
     system_labels = ['INBOX']
-    results = service.users().messages().list(userId='me', labelIds=system_labels, maxResults=5).execute()
+    results = service.users().messages().list(userId='me', labelIds=system_labels, maxResults=page_size, pageToken=cursor).execute()
     messages = results.get('messages', [])
 
-    suggestions = []
+    def fetch(msg):
+        return (msg['id'],) + fetch_headers(service, msg['id'])
 
-    for msg in messages:
-        msg_detail = service.users().messages().get(userId='me', id=msg['id'], format='metadata', metadataHeaders=['From', 'Subject']).execute()
-        headers = msg_detail.get('payload', {}).get('headers', [])
-        msg_from = next((h['value'] for h in headers if h['name'] == 'From'), '')
-        msg_subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '')
+    def classify(item):
+        msg_id, msg_from, msg_subject = item
+        prompt = prompt_prefix + f"\n\nSender: {msg_from}\nSubject: {msg_subject}\nLabel:"
 
-        example_lines = [f'Sender: {s}\nSubject: {subj}\nLabel: {lbl}' for s, subj, lbl in training_examples]
-        prompt = "You are an email labeling assistant. Based on the following examples, suggest a label:\n\n"
-        prompt += "\n\n".join(example_lines)
-        prompt += f"\n\nSender: {msg_from}\nSubject: {msg_subject}\nLabel:"
-
-        response = openai.ChatCompletion.create(
+        response = get_openai().ChatCompletion.create(
             model="gpt-4",
             messages=[
                 {"role": "system", "content": "You are an email categorizer."},
@@ -179,44 +414,53 @@ def suggest_labels():
         )
 
         label_suggestion = response['choices'][0]['message']['content'].strip()
-        suggestions.append({
+        return {
+            "id": msg_id,
             "from": msg_from,
             "subject": msg_subject,
             "suggested_label": label_suggestion
-        })
-
-    html_template = '''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Label Suggestions</title>
-        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css" rel="stylesheet">
-    </head>
-    <body class="container mt-4">
-        <h2>ChatGPT-Suggested Email Labels</h2>
-        <table class="table table-bordered table-striped">
-            <thead class="table-dark">
-                <tr>
-                    <th>From</th>
-                    <th>Subject</th>
-                    <th>Suggested Label</th>
-                </tr>
-            </thead>
-            <tbody>
-                {% for s in suggestions %}
-                <tr>
-                    <td>{{ s.from }}</td>
-                    <td>{{ s.subject }}</td>
-                    <td>{{ s.suggested_label }}</td>
-                </tr>
-                {% endfor %}
-            </tbody>
-        </table>
-    </body>
-    </html>
-    '''
-
-    return render_template_string(html_template, suggestions=suggestions)
+        }
+
+    pipeline = Pipeline([
+        Stage('fetch', fetch, workers=FETCH_WORKERS),
+        Stage('classify', classify, workers=CLASSIFY_WORKERS),
+    ])
+    return pipeline.stream(messages), results.get('nextPageToken')
+
+@app.route('/suggest-labels')
+def suggest_labels():
+    user_email = request.args.get("email")
+    creds = load_user_token(user_email)
+    if not creds:
+        return "User not authenticated", 401
+
+    page_size = parse_page_size()
+    suggestions, next_cursor = suggestion_stream(creds, user_email, request.args.get("cursor"), page_size)
+    # The template is compiled once and cached by Jinja; rows are flushed as they render
+    return Response(stream_template(
+        'suggest_labels.html',
+        suggestions=suggestions,
+        email=user_email,
+        next_cursor=next_cursor,
+        page_size=page_size
+    ), mimetype='text/html')
+
+@app.route('/api/suggest-labels')
+def api_suggest_labels():
+    # Newline-delimited JSON: one suggestion per line, then a final {"next_cursor": ...} line
+    user_email = request.args.get("email")
+    creds = load_user_token(user_email)
+    if not creds:
+        return jsonify({'error': 'User not authenticated'}), 401
+
+    suggestions, next_cursor = suggestion_stream(creds, user_email, request.args.get("cursor"), parse_page_size())
+
+    def generate():
+        for suggestion in suggestions:
+            yield json.dumps(suggestion) + "\n"
+        yield json.dumps({'next_cursor': next_cursor}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
@@ -0,0 +1,292 @@
+import os
+import re
+import json
+import logging
+import argparse
+import multiprocessing as mp
+from collections import defaultdict, Counter
+from email.utils import parseaddr
+from rule_store import RuleFile, match_compiled
+from rule_suggester import get_domain_root, GENERIC_DOMAINS
+from pipeline import Pipeline, Stage
+from run_journal import RunJournal
+from gmail_connect import RULES_FILE, setup_logging, authenticate_gmail, fetch_headers, list_message_ids, get_or_create_label_id
+
+# Backfill for onboarding a mailbox with years of history.
+#   python backfill.py snapshot mailbox.jsonl        # list + fetch From/Subject for every message
+#   python backfill.py classify mailbox.jsonl        # classify on all cores, record a plan
+#   python backfill.py classify mailbox.jsonl --apply
+# Classification is CPU-bound, so the snapshot is split into byte ranges and
+# handed to a process pool. Workers read their own range from the file, and the
+# classifier (compiled rules + example index) is built once in the parent and
+# inherited through fork, so nothing but (start, end) offsets is pickled per task.
+# The snapshot covers archived mail too, but not sent mail, drafts or chats. It is
+# appended to as messages are fetched, so an interrupted snapshot is resumed by
+# running the same command again.
+
+EXAMPLES_FILE = 'labeled_examples.jsonl'
+SNAPSHOT_QUERY = '-in:sent -in:drafts -in:chats'
+SHARDS_PER_WORKER = 4
+BATCH_MODIFY_LIMIT = 1000  # Gmail's per-call limit for messages.batchModify
+FETCH_WORKERS = 8
+APPLY_WORKERS = 2
+
+_classifier = None
+
+def subject_fingerprint(subject):
+    # Collapse numbers, punctuation and spacing so "Order #123 shipped" matches "Order #987 shipped"
+    subject = re.sub(r'\d+', '#', (subject or '').lower())
+    subject = re.sub(r'[^\w#]+', ' ', subject)
+    return subject.strip()
+
+def unique_labels(counts):
+    # Keep only keys that always mapped to the same label
+    return {key: next(iter(labels)) for key, labels in counts.items() if len(labels) == 1}
+
+def build_example_index(examples):
+    senders = defaultdict(Counter)
+    fingerprints = defaultdict(Counter)
+    domains = defaultdict(Counter)
+    for ex in examples:
+        label = ex['label']
+        _, address = parseaddr(ex['from'])
+        if address:
+            senders[address.lower()][label] += 1
+        fingerprint = subject_fingerprint(ex['subject'])
+        if fingerprint:
+            fingerprints[fingerprint][label] += 1
+        domain_root = get_domain_root(ex['from'])
+        if domain_root and domain_root not in GENERIC_DOMAINS:
+            domains[domain_root][label] += 1
+    return {
+        'sender': unique_labels(senders),
+        'fingerprint': unique_labels(fingerprints),
+        'domain': unique_labels(domains)
+    }
+
+def load_examples(path=EXAMPLES_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def load_classifier(rules_path=RULES_FILE, examples_path=EXAMPLES_FILE):
+    return {
+        'rules': RuleFile(rules_path).compiled(),
+        'examples': build_example_index(load_examples(examples_path))
+    }
+
+def classify(classifier, sender, subject):
+    # Explicit rules win; after that, the most specific example match
+    label = match_compiled(classifier['rules'], sender, subject)
+    if label:
+        return label
+    examples = classifier['examples']
+    _, address = parseaddr(sender or '')
+    label = examples['sender'].get(address.lower())
+    if label:
+        return label
+    label = examples['fingerprint'].get(subject_fingerprint(subject))
+    if label:
+        return label
+    return examples['domain'].get(get_domain_root(sender or ''))
+
+def init_worker(rules_path, examples_path):
+    # Only used when fork isn't the start method: each worker builds the classifier once
+    global _classifier
+    _classifier = load_classifier(rules_path, examples_path)
+
+def make_shards(path, count):
+    size = os.path.getsize(path)
+    step = max(1, size // count + 1)
+    return [(path, start, min(start + step, size)) for start in range(0, size, step)]
+
+def classify_shard(shard):
+    # A line belongs to the shard its first byte falls in
+    path, start, end = shard
+    processed = 0
+    matches = []
+    with open(path, 'rb') as f:
+        if start:
+            f.seek(start - 1)
+            f.readline()
+        pos = f.tell()
+        while pos < end:
+            line = f.readline()
+            if not line.endswith(b'\n'):
+                # EOF, or the partial last line of a snapshot that was killed mid-write
+                break
+            pos += len(line)
+            if not line.strip():
+                continue
+            msg = json.loads(line)
+            processed += 1
+            label = classify(_classifier, msg.get('from'), msg.get('subject'))
+            if label:
+                matches.append((msg['id'], label))
+    return processed, matches
+
+def classify_snapshot(path, workers, rules_path=RULES_FILE, examples_path=EXAMPLES_FILE):
+    global _classifier
+    shards = make_shards(path, workers * SHARDS_PER_WORKER)
+    if mp.get_start_method() == 'fork':
+        # Only where fork is already the default (it is unsafe on macOS and no longer
+        # the default elsewhere on newer Pythons). Built before the pool starts so
+        # forked workers share it copy-on-write
+        _classifier = load_classifier(rules_path, examples_path)
+        pool = mp.Pool(workers)
+    else:
+        pool = mp.Pool(workers, initializer=init_worker, initargs=(rules_path, examples_path))
+    with pool:
+        for processed, matches in pool.imap_unordered(classify_shard, shards):
+            yield processed, matches
+
+def load_snapshot_ids(path):
+    # IDs already in the snapshot; a partial last line left by a killed run is cut off
+    ids = set()
+    if not os.path.exists(path):
+        return ids
+    with open(path, 'rb+') as f:
+        complete = 0
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            complete += len(line)
+            if line.strip():
+                ids.add(json.loads(line)['id'])
+        f.truncate(complete)
+    return ids
+
+def snapshot(service, path):
+    saved = load_snapshot_ids(path)
+    if saved:
+        logging.info(f"Resuming snapshot {path}: {len(saved)} message(s) already saved")
+
+    def unseen(msg_id):
+        return None if msg_id in saved else msg_id
+
+    def fetch(msg_id):
+        msg_from, msg_subject = fetch_headers(service, msg_id)
+        return {'id': msg_id, 'from': msg_from, 'subject': msg_subject}
+
+    def open_snapshot():
+        return open(path, 'a')
+
+    def write(f, msg):
+        f.write(json.dumps(msg) + '\n')
+        return None
+
+    pipeline = Pipeline([
+        Stage('skip-saved', unseen),
+        Stage('fetch', fetch, workers=FETCH_WORKERS),
+        Stage('write', write, setup=open_snapshot, teardown=lambda f: f.close()),
+    ])
+    pipeline.run(list_message_ids(service, None, query=SNAPSHOT_QUERY))
+    logging.info(f"Snapshot written to {path}: {pipeline.stats['write']['processed']} new message(s), {len(saved)} already saved")
+    fetch_errors = pipeline.stats['fetch']['errors']
+    if fetch_errors:
+        logging.error(f"❌ {fetch_errors} message(s) could not be fetched; run snapshot again to pick them up")
+    return fetch_errors
+
+def plan_backfill(journal, path, workers):
+    total = planned = 0
+    for processed, matches in classify_snapshot(path, workers):
+        total += processed
+        for msg_id, label in matches:
+            if not journal.seen(msg_id):
+                journal.plan(msg_id, label)
+                planned += 1
+    journal.mark_planning_done()
+    logging.info(f"Classified {total} messages; planned {planned} label action(s)")
+
+def label_batches(actions):
+    by_label = defaultdict(list)
+    for msg_id, label in actions:
+        by_label[label].append(msg_id)
+    for label, ids in by_label.items():
+        for i in range(0, len(ids), BATCH_MODIFY_LIMIT):
+            yield label, ids[i:i + BATCH_MODIFY_LIMIT]
+
+def apply_backfill(service, journal):
+    label_ids = {}
+
+    def modify(label, ids):
+        # Returns the IDs that were labeled. A batch Gmail rejects (e.g. an ID deleted since
+        # the snapshot) is split and retried so only the bad IDs fail; any other error fails
+        # the whole batch. Failed IDs count towards the journal's MAX_ATTEMPTS.
+        try:
+            service.users().messages().batchModify(userId='me', body={
+                'ids': ids,
+                'addLabelIds': [label_ids[label]],
+                'removeLabelIds': ['INBOX']
+            }).execute()
+            return ids
+        except Exception as e:
+            status = getattr(getattr(e, 'resp', None), 'status', None)
+            if len(ids) > 1 and status in (400, 404):
+                middle = len(ids) // 2
+                return modify(label, ids[:middle]) + modify(label, ids[middle:])
+            logging.error(f"❌ Failed to label {len(ids)} message(s) as {label}: {e}")
+            for msg_id in ids:
+                journal.fail(msg_id, label)
+            return []
+
+    def apply(batch):
+        label, ids = batch
+        labeled = modify(label, ids)
+        return (label, labeled) if labeled else None
+
+    def commit(batch):
+        label, ids = batch
+        for msg_id in ids:
+            journal.commit(msg_id, label)
+        journal.flush()
+        logging.info(f"Labeled {len(ids)} message(s) as {label}")
+
+    # Label creation isn't safe to race, so resolve labels before fanning out
+    batches = list(label_batches(journal.pending()))
+    for label in {label for label, _ in batches}:
+        label_ids[label] = get_or_create_label_id(service, 'me', label)
+
+    Pipeline([
+        Stage('apply', apply, workers=APPLY_WORKERS),
+        Stage('commit', commit),
+    ]).run(batches)
+    if not journal.pending():
+        journal.finish()
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill labels across a whole mailbox")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    snapshot_parser = subparsers.add_parser('snapshot', help="Save From/Subject for every message to a JSONL file")
+    snapshot_parser.add_argument('path')
+
+    classify_parser = subparsers.add_parser('classify', help="Classify a snapshot on all cores and record the plan")
+    classify_parser.add_argument('path')
+    classify_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    classify_parser.add_argument('--apply', action='store_true', help="Apply the planned labels with batchModify")
+
+    args = parser.parse_args()
+    setup_logging()
+
+    if args.command == 'snapshot':
+        if snapshot(authenticate_gmail(), args.path):
+            raise SystemExit(1)
+        return
+
+    journal = RunJournal(f"backfill:{os.path.abspath(args.path)}")
+    try:
+        if journal.planning_done:
+            logging.info(f"Resuming backfill run {journal.run_id}; classification already done")
+        else:
+            plan_backfill(journal, args.path, args.workers)
+        if args.apply:
+            apply_backfill(authenticate_gmail(), journal)
+        progress = journal.progress()
+    finally:
+        journal.close()
+    logging.info(f"Backfill run {progress['run_id']} {progress['status']}: {progress['committed']} labeled, {progress['planned']} pending, {progress['failed']} failed")
+
+if __name__ == '__main__':
+    main()
@@ -1,47 +1,101 @@
 import os
+import sys
 import json
 import time
 import logging
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
+import threading
+from rule_store import RuleFile, match_compiled
+from gmail_http import PooledHttp, gmail_service, build_service, data_path, load_discovery_document
+from pipeline import Pipeline, Stage
+from run_journal import RunJournal, JOURNAL_DB
 
 SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
-RULES_FILE = 'rules.json'
-
-# 🔧 Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s — %(levelname)s — %(message)s',
-    handlers=[
-        logging.FileHandler("organizer.log"),
-        logging.StreamHandler()  # Remove this line if you don't want console output
-    ]
-)
-
-def load_rules():
-    if os.path.exists(RULES_FILE):
-        with open(RULES_FILE, 'r') as f:
-            return json.load(f)
-    return []
-
-def apply_label(service, user_id, msg_id, label_name):
+RULES_FILE = data_path('rules.json')
+TOKEN_FILE = data_path('organizer_token.json')
+RUN_NAME = 'organize-inbox'
+FETCH_WORKERS = 8
+APPLY_WORKERS = 4
+PROGRESS_EVERY = 100
+LOG_FILE = data_path('organizer.log')
+
+def setup_logging():
+    # 🔧 Called from the command-line entry points only, so importing these helpers
+    # (e.g. from the web app) doesn't redirect the importer's logging into organizer.log
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s — %(levelname)s — %(message)s',
+        handlers=[
+            logging.FileHandler(LOG_FILE),
+            logging.StreamHandler()  # Remove this line if you don't want console output
+        ]
+    )
+
+_rules_store = None
+
+def get_rules_store():
+    # Long-running organizers re-read rules.json only when it has changed on disk
+    global _rules_store
+    if _rules_store is None:
+        _rules_store = RuleFile(RULES_FILE)
+    else:
+        _rules_store.reload_if_changed()
+    return _rules_store
+
+def fetch_headers(service, msg_id):
+    msg_detail = service.users().messages().get(userId='me', id=msg_id, format='metadata', metadataHeaders=['From', 'Subject']).execute()
+    headers = msg_detail.get('payload', {}).get('headers', [])
+    msg_from = next((h['value'] for h in headers if h['name'] == 'From'), '')
+    msg_subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '')
+    return msg_from, msg_subject
+
+def list_message_ids(service, label_ids, query=None):
+    page_token = None
+    while True:
+        results = service.users().messages().list(userId='me', labelIds=label_ids, q=query, pageToken=page_token, maxResults=500).execute()
+        for msg in results.get('messages', []):
+            yield msg['id']
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+
+def get_or_create_label_id(service, user_id, label_name):
+    label_list = service.users().labels().list(userId=user_id).execute().get('labels', [])
+    for label in label_list:
+        if label['name'] == label_name:
+            return label['id']
+
+    label_obj = {
+        'name': label_name,
+        'labelListVisibility': 'labelShow',
+        'messageListVisibility': 'show'
+    }
+    new_label = service.users().labels().create(userId=user_id, body=label_obj).execute()
+    return new_label['id']
+
+class LabelResolver:
+    # Label name -> ID for one account, looked up (or created) once and shared by the
+    # parallel apply workers. Creating the same label from several threads races and
+    # all but one get a 409, so every lookup goes through one lock.
+    def __init__(self, service, user_id='me'):
+        self.service = service
+        self.user_id = user_id
+        self._lock = threading.Lock()
+        self._ids = None
+
+    def label_id(self, label_name):
+        with self._lock:
+            if self._ids is None:
+                label_list = self.service.users().labels().list(userId=self.user_id).execute().get('labels', [])
+                self._ids = {label['name']: label['id'] for label in label_list}
+            if label_name not in self._ids:
+                self._ids[label_name] = get_or_create_label_id(self.service, self.user_id, label_name)
+            return self._ids[label_name]
+
+def apply_label(service, user_id, msg_id, label_name, label_id=None):
+    # Pass label_id (e.g. from a LabelResolver) to skip the per-message label lookup
     try:
-        label_id = None
-        label_list = service.users().labels().list(userId=user_id).execute().get('labels', [])
-        for label in label_list:
-            if label['name'] == label_name:
-                label_id = label['id']
-                break
-
-        if not label_id:
-            label_obj = {
-                'name': label_name,
-                'labelListVisibility': 'labelShow',
-                'messageListVisibility': 'show'
-            }
-            new_label = service.users().labels().create(userId=user_id, body=label_obj).execute()
-            label_id = new_label['id']
+        if label_id is None:
+            label_id = get_or_create_label_id(service, user_id, label_name)
 
         service.users().messages().modify(
             userId=user_id,
@@ -53,21 +107,148 @@ def apply_label(service, user_id, msg_id, label_name):
         ).execute()
 
         logging.info(f"Labeled and archived message ID {msg_id} as {label_name}")
+        return True
 
     except Exception as e:
         logging.error(f"❌ Failed to apply label to message ID {msg_id}: {e}")
+        return False
+
+def load_stored_credentials():
+    # Token saved by the first interactive run; the refresh token keeps it usable
+    if not os.path.exists(TOKEN_FILE):
+        return None
+    from google.oauth2.credentials import Credentials
+    creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+    return creds if creds.refresh_token else None
+
+def save_credentials(creds):
+    # Only readable by the owner: it holds the refresh token
+    fd = os.open(TOKEN_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(creds.to_json())
 
 def authenticate_gmail():
+    # Scheduled runs use the stored token; only the first run (from a terminal) asks
+    creds = load_stored_credentials()
+    if creds:
+        return gmail_service(creds)
+
+    if sys.stdin is None or not sys.stdin.isatty():
+        raise RuntimeError(f"No stored Gmail token in {TOKEN_FILE}; run gmail_connect once from a terminal to authorize")
+
     credentials_dict = json.loads(os.getenv("GOOGLE_CREDENTIALS_JSON", "{}"))
     if not credentials_dict:
         raise ValueError("Missing GOOGLE_CREDENTIALS_JSON environment variable")
 
+    # Imported here so the packaged organizer starts without loading the OAuth stack
+    from google_auth_oauthlib.flow import Flow
+
     flow = Flow.from_client_config(credentials_dict, SCOPES)
-    auth_url, _ = flow.authorization_url(access_type='offline', include_granted_scopes='true')
+    auth_url, _ = flow.authorization_url(access_type='offline', prompt='consent', include_granted_scopes='true')
     print(f"🔗 Visit this URL to authorize the app:\n{auth_url}")
     code = input("Paste the authorization code here: ")
     flow.fetch_token(code=code)
 
     creds = flow.credentials
-    service = build('gmail', 'v1', credentials=creds)
-    return service
+    save_credentials(creds)
+    logging.info(f"Saved Gmail token to {TOKEN_FILE}")
+    return gmail_service(creds)
+
+def organize_inbox(service, journal):
+    # Resumable: anything the journal already saw is skipped, and actions planned by
+    # a killed run (or left over by a finished one) are applied before new inbox
+    # messages are looked at
+    compiled_rules = get_rules_store().compiled()
+    labels = LabelResolver(service)
+
+    def resolve(item):
+        msg_id, label_name = item
+        return msg_id, label_name, labels.label_id(label_name)
+
+    def apply(item):
+        msg_id, label_name, label_id = item
+        if apply_label(service, 'me', msg_id, label_name, label_id):
+            return msg_id, label_name
+        journal.fail(msg_id, label_name)
+        return None
+
+    committed = [0]
+
+    def commit(item):
+        journal.commit(*item)
+        committed[0] += 1
+        if committed[0] % PROGRESS_EVERY == 0:
+            progress = journal.progress()
+            logging.info(f"Run {progress['run_id']}: {progress['committed']} labeled, {progress['planned']} pending, {progress['skipped']} unmatched")
+
+    pending = journal.pending()
+    if pending:
+        logging.info(f"Resuming run {journal.run_id}: {len(pending)} planned action(s) to apply")
+        Pipeline([
+            Stage('resolve', resolve),
+            Stage('apply', apply, workers=APPLY_WORKERS),
+            Stage('commit', commit),
+        ]).run(pending)
+
+    if not journal.planning_done:
+        def unseen(msg_id):
+            return None if journal.seen(msg_id) else msg_id
+
+        def fetch(msg_id):
+            return (msg_id,) + fetch_headers(service, msg_id)
+
+        def classify(item):
+            msg_id, msg_from, msg_subject = item
+            label_name = match_compiled(compiled_rules, msg_from, msg_subject)
+            journal.plan(msg_id, label_name)
+            return resolve((msg_id, label_name)) if label_name else None
+
+        Pipeline([
+            Stage('skip-seen', unseen),
+            Stage('fetch', fetch, workers=FETCH_WORKERS),
+            Stage('classify', classify),
+            Stage('apply', apply, workers=APPLY_WORKERS),
+            Stage('commit', commit),
+        ]).run(list_message_ids(service, ['INBOX']))
+        journal.mark_planning_done()
+
+    # Anything still planned failed to apply; the next run picks it up and rescans the inbox
+    journal.finish()
+    return journal.progress()
+
+def startup_check():
+    # Does everything a scheduled run does before its first API call (stored token,
+    # service built from the discovery document, rules), then exits; used by startup_bench.py
+    from google.auth.credentials import AnonymousCredentials
+    creds = load_stored_credentials() or AnonymousCredentials()
+    if load_discovery_document() is None:
+        raise RuntimeError("Missing discovery/gmail.v1.json; run python gmail_http.py")
+    http = PooledHttp(creds)
+    try:
+        build_service(http)
+    finally:
+        http.close()
+    get_rules_store()
+
+def main():
+    setup_logging()
+    if '--startup-check' in sys.argv[1:]:
+        startup_check()
+        return
+
+    try:
+        service = authenticate_gmail()
+    except (RuntimeError, ValueError) as e:
+        logging.error(f"❌ {e}")
+        sys.exit(1)
+    journal = RunJournal(RUN_NAME, data_path(JOURNAL_DB))
+    if journal.resumed:
+        logging.info(f"Resuming unfinished run {journal.run_id}")
+    try:
+        progress = organize_inbox(service, journal)
+    finally:
+        journal.close()
+    logging.info(f"Run {progress['run_id']} {progress['status']}: {progress['committed']} labeled, {progress['skipped']} unmatched, {progress['planned']} retry next run, {progress['failed']} failed")
+
+if __name__ == '__main__':
+    main()
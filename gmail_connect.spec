@@ -1,38 +1,82 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
+
+# onedir by default: the onefile build unpacks the whole Google client stack to a
+# temp dir on every launch. Set ORGANIZER_ONEFILE=1 to build the single exe instead.
+ONEFILE = os.environ.get('ORGANIZER_ONEFILE') == '1'
+
+# Ship only the precomputed Gmail discovery document (python gmail_http.py writes it,
+# committed under discovery/) instead of the hundreds of documents googleapiclient bundles
+DISCOVERY_FILE = os.path.join(SPECPATH, 'discovery', 'gmail.v1.json')
+datas = [(DISCOVERY_FILE, 'discovery')] if os.path.exists(DISCOVERY_FILE) else []
+
+
+def keep_data(entry):
+    dest = entry[0].replace('\\', '/')
+    return not (datas and dest.startswith('googleapiclient/discovery_cache/documents/'))
 
 
 a = Analysis(
     ['gmail_connect.py'],
     pathex=[],
     binaries=[],
-    datas=[],
+    datas=datas,
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=['tkinter', 'flask', 'openai'],
     noarchive=False,
     optimize=0,
 )
+a.datas = [entry for entry in a.datas if keep_data(entry)]
 pyz = PYZ(a.pure)
 
-exe = EXE(
-    pyz,
-    a.scripts,
-    a.binaries,
-    a.datas,
-    [],
-    name='gmail_connect',
-    debug=False,
-    bootloader_ignore_signals=False,
-    strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
-    console=False,
-    disable_windowed_traceback=False,
-    argv_emulation=False,
-    target_arch=None,
-    codesign_identity=None,
-    entitlements_file=None,
-)
+if ONEFILE:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        a.binaries,
+        a.datas,
+        [],
+        name='gmail_connect',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=True,
+        upx_exclude=[],
+        runtime_tmpdir=None,
+        console=True,  # scheduled runs log to stdout; a windowed build has no stdin for the first authorization
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
+else:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        [],
+        exclude_binaries=True,
+        name='gmail_connect',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=False,  # compressed binaries would have to be decompressed on every launch
+        console=True,  # scheduled runs log to stdout; a windowed build has no stdin for the first authorization
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
+    coll = COLLECT(
+        exe,
+        a.binaries,
+        a.datas,
+        strip=False,
+        upx=False,
+        upx_exclude=[],
+        name='gmail_connect',
+    )
@@ -0,0 +1,153 @@
+import os
+import sys
+import json
+import threading
+from collections import OrderedDict
+
+# Pooled, thread-safe transport for the googleapiclient Gmail service.
+# The default httplib2 transport opens a fresh connection per Http object and
+# can't be shared across threads. PooledHttp keeps the httplib2 interface that
+# googleapiclient expects but sends requests through a requests/urllib3 session
+# with a keep-alive connection pool, so one service can be shared by every
+# pipeline worker and TLS handshakes are paid once per pooled connection.
+#
+# The Google client libraries are imported on first use, and the Gmail discovery
+# document is read from discovery/gmail.v1.json (written by dump_discovery_document)
+# and parsed once per process, so startup doesn't pay for either.
+#
+# The web app keeps one service (and so one connection pool) per account in
+# account_service; a pool is closed when its account is evicted or re-authorized.
+
+POOL_SIZE = 16
+TIMEOUT = 60
+DISCOVERY_FILE = os.path.join('discovery', 'gmail.v1.json')
+MAX_CACHED_SERVICES = 32
+
+_discovery_doc = None
+_discovery_lock = threading.Lock()
+_services = OrderedDict()  # email -> (credentials key, service, PooledHttp), least recently used first
+_services_lock = threading.Lock()
+
+def resource_path(relative_path):
+    # PyInstaller puts bundled data next to the executable (onedir) or in _MEIPASS (onefile)
+    base = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base, relative_path)
+
+def data_path(relative_path):
+    # Files the organizer reads and writes (rules, token, log, run journal). From source
+    # they stay relative to the working directory. A packaged build keeps them beside the
+    # build: next to a onefile exe, or next to the onedir folder (dist/, not
+    # dist/gmail_connect/) so rebuilding the folder can't delete them.
+    # ORGANIZER_DATA_DIR overrides both.
+    base = os.environ.get('ORGANIZER_DATA_DIR')
+    if not base and getattr(sys, 'frozen', False):
+        base = os.path.dirname(os.path.abspath(sys.executable))
+        bundle = os.path.abspath(sys._MEIPASS)
+        if bundle == base or bundle.startswith(base + os.sep):
+            base = os.path.dirname(base)
+    return os.path.join(base, relative_path) if base else relative_path
+
+class PooledHttp:
+    def __init__(self, credentials, pool_size=POOL_SIZE, timeout=TIMEOUT):
+        import requests
+        from google.auth.transport.requests import AuthorizedSession
+
+        self.credentials = credentials
+        self.timeout = timeout
+        # AuthorizedSession adds the bearer token and refreshes it on 401
+        self.session = AuthorizedSession(credentials)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5, connection_type=None):
+        import httplib2
+
+        response = self.session.request(
+            method,
+            uri,
+            data=body,
+            headers=headers,
+            timeout=self.timeout,
+            allow_redirects=redirections > 0
+        )
+        # googleapiclient reads status and lowercased headers off an httplib2.Response
+        info = {k.lower(): v for k, v in response.headers.items()}
+        info['status'] = str(response.status_code)
+        return httplib2.Response(info), response.content
+
+    def close(self):
+        self.session.close()
+
+def load_discovery_document():
+    global _discovery_doc
+    with _discovery_lock:
+        if _discovery_doc is None:
+            path = resource_path(DISCOVERY_FILE)
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    _discovery_doc = json.load(f)
+        return _discovery_doc
+
+def dump_discovery_document(path=None):
+    # Copies the Gmail document bundled with googleapiclient so builds and packaging
+    # only need this one file instead of the whole discovery cache. Written next to
+    # this module, where load_discovery_document and the PyInstaller spec look for it.
+    from googleapiclient.discovery_cache import get_static_doc
+
+    path = path or resource_path(DISCOVERY_FILE)
+
+    doc = get_static_doc('gmail', 'v1')
+    if doc is None:
+        raise ValueError("googleapiclient has no bundled gmail v1 discovery document")
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(doc)
+    return path
+
+def gmail_service(creds, pool_size=POOL_SIZE):
+    # Safe to share across threads, unlike build('gmail', 'v1', credentials=creds).
+    # The caller owns the pool: call service.close() when done, or use account_service.
+    return build_service(PooledHttp(creds, pool_size=pool_size))
+
+def build_service(http):
+    from googleapiclient.discovery import build, build_from_document
+
+    doc = load_discovery_document()
+    if doc is not None:
+        return build_from_document(doc, http=http)
+    return build('gmail', 'v1', http=http, cache_discovery=False)
+
+def credentials_key(creds):
+    # Stored credentials are reloaded per request, so compare what identifies the grant
+    return (creds.refresh_token, creds.client_id, tuple(sorted(creds.scopes or ())))
+
+def account_service(email, creds, pool_size=POOL_SIZE):
+    # One cached service per account, rebuilt (and the old pool closed) when the
+    # account's credentials change
+    key = credentials_key(creds)
+    stale = []
+    with _services_lock:
+        entry = _services.get(email)
+        if entry and entry[0] == key:
+            _services.move_to_end(email)
+            return entry[1]
+        if entry:
+            stale.append(_services.pop(email))
+        http = PooledHttp(creds, pool_size=pool_size)
+        service = build_service(http)
+        _services[email] = (key, service, http)
+        while len(_services) > MAX_CACHED_SERVICES:
+            stale.append(_services.popitem(last=False)[1])
+    for _, _, http in stale:
+        http.close()
+    return service
+
+def forget_account_service(email):
+    with _services_lock:
+        entry = _services.pop(email, None)
+    if entry:
+        entry[2].close()
+
+if __name__ == '__main__':
+    print(f"📄 Wrote {dump_discovery_document()}")
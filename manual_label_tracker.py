@@ -3,11 +3,13 @@ import pickle
 import json
 from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from pipeline import Pipeline, Stage
+from gmail_http import gmail_service
 
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
 LABELS_TO_WATCH = ['@Later', '@Finance', '@News']
 EXAMPLES_FILE = 'labeled_examples.jsonl'
+FETCH_WORKERS = 8
 
 def load_credentials():
     creds = None
@@ -28,23 +30,31 @@ def get_label_map(service):
     labels_result = service.users().labels().list(userId='me').execute()
     return {label['id']: label['name'] for label in labels_result['labels']}
 
-def already_saved(example):
+def example_key(example):
+    return (example['from'], example['subject'], example['label'])
+
+def load_saved_keys():
     if not os.path.exists(EXAMPLES_FILE):
-        return False
+        return set()
     with open(EXAMPLES_FILE, 'r') as f:
-        for line in f:
-            saved = json.loads(line)
-            if saved['from'] == example['from'] and saved['subject'] == example['subject'] and saved['label'] == example['label']:
-                return True
-    return False
+        return {example_key(json.loads(line)) for line in f}
+
+def already_saved(example, saved_keys):
+    return example_key(example) in saved_keys
+
+def save_example(example, f):
+    f.write(json.dumps(example) + '\n')
 
-def save_example(example):
-    with open(EXAMPLES_FILE, 'a') as f:
-        f.write(json.dumps(example) + '\n')
+def open_writer():
+    # The writer stage owns the examples file and the set of examples already in it
+    return {'saved': load_saved_keys(), 'file': open(EXAMPLES_FILE, 'a')}
+
+def close_writer(writer):
+    writer['file'].close()
 
 def main():
     creds = load_credentials()
-    service = build('gmail', 'v1', credentials=creds)
+    service = gmail_service(creds)
     label_map = get_label_map(service)
 
     # Reverse the map to get label names from IDs
@@ -59,14 +69,15 @@ def main():
     messages = results.get('messages', [])
     print(f"🔍 Found {len(messages)} messages with watched labels.")
 
-    for msg in messages:
-        msg_data = service.users().messages().get(
+    def fetch(msg):
+        return service.users().messages().get(
             userId='me',
             id=msg['id'],
             format='metadata',
             metadataHeaders=['Subject', 'From']
         ).execute()
 
+    def decide(msg_data):
         headers = msg_data['payload'].get('headers', [])
         sender = subject = '(unknown)'
         for header in headers:
@@ -75,18 +86,32 @@ def main():
             elif header['name'] == 'Subject':
                 subject = header['value']
 
+        examples = []
         label_ids = msg_data.get('labelIds', [])
         for label_id in label_ids:
             label_name = label_map.get(label_id)
             if label_name in LABELS_TO_WATCH:
-                example = {
+                examples.append({
                     'from': sender,
                     'subject': subject,
                     'label': label_name
-                }
-                if not already_saved(example):
-                    save_example(example)
-                    print(f"✅ Saved: {example}")
+                })
+        return examples
+
+    def write(writer, example):
+        if not already_saved(example, writer['saved']):
+            save_example(example, writer['file'])
+            writer['saved'].add(example_key(example))
+            print(f"✅ Saved: {example}")
+            return example
+        return None
+
+    pipeline = Pipeline([
+        Stage('fetch', fetch, workers=FETCH_WORKERS),
+        Stage('decide', decide, fan_out=True),
+        Stage('write', write, setup=open_writer, teardown=close_writer),
+    ])
+    pipeline.run(messages)
 
 if __name__ == '__main__':
     main()
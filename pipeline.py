@@ -0,0 +1,159 @@
+import logging
+import queue
+import threading
+
+# Small producer/consumer pipeline used by the organizer flows.
+# A source iterable feeds a chain of stages; each stage has its own worker
+# threads and a bounded input queue, so slow network stages overlap and a slow
+# consumer applies backpressure instead of letting work pile up in memory.
+
+DEFAULT_QUEUE_SIZE = 100
+_DONE = object()
+
+class Stage:
+    # fn(item) -> result, or fn(resource, item) when setup is given; setup() runs
+    # once per worker thread and teardown(resource) when that worker finishes.
+    # Returning None drops the item. With fan_out=True, fn returns an iterable and
+    # every element is passed downstream.
+    def __init__(self, name, fn, workers=1, maxsize=DEFAULT_QUEUE_SIZE, setup=None, teardown=None, fan_out=False):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.maxsize = maxsize
+        self.setup = setup
+        self.teardown = teardown
+        self.fan_out = fan_out
+
+class Pipeline:
+    def __init__(self, stages):
+        self.stages = stages
+        self.stats = {}
+        self._failure = None
+
+    def run(self, source):
+        # Runs to completion and returns the outputs of the last stage
+        return list(self.stream(source))
+
+    def stream(self, source):
+        # Yields outputs of the last stage as soon as they are ready
+        queues = [queue.Queue(maxsize=stage.maxsize) for stage in self.stages]
+        output = queue.Queue(maxsize=DEFAULT_QUEUE_SIZE)
+        queues.append(output)
+        self.stats = {stage.name: {'processed': 0, 'errors': 0} for stage in self.stages}
+        stop = threading.Event()
+        self._failure = None
+        threads = []
+
+        feeder = threading.Thread(target=self._feed, args=(source, queues[0], self.stages[0].workers, stop), daemon=True)
+        threads.append(feeder)
+
+        for i, stage in enumerate(self.stages):
+            downstream_workers = self.stages[i + 1].workers if i + 1 < len(self.stages) else 1
+            remaining = [stage.workers]
+            lock = threading.Lock()
+            for _ in range(stage.workers):
+                t = threading.Thread(
+                    target=self._work,
+                    args=(stage, queues[i], queues[i + 1], downstream_workers, remaining, lock, stop),
+                    daemon=True
+                )
+                threads.append(t)
+
+        for t in threads:
+            t.start()
+
+        try:
+            while True:
+                item = _get(output, stop)
+                if item is _DONE:
+                    break
+                yield item
+            if self._failure:
+                raise RuntimeError(self._failure)
+        finally:
+            # Consumer went away early: let blocked workers drain out
+            stop.set()
+            for q in queues:
+                _drain(q)
+            for t in threads:
+                t.join(timeout=1)
+
+    def _feed(self, source, out_q, consumers, stop):
+        try:
+            for item in source:
+                if not _put(out_q, item, stop):
+                    return
+        except Exception as e:
+            # A truncated source must not look like a normal end of stream
+            self._failure = f"Pipeline source failed: {e}"
+            logging.error(f"❌ {self._failure}")
+            stop.set()
+            return
+        for _ in range(consumers):
+            _put(out_q, _DONE, stop)
+
+    def _work(self, stage, in_q, out_q, downstream_workers, remaining, lock, stop):
+        resource = None
+        try:
+            if stage.setup:
+                resource = stage.setup()
+            while True:
+                item = _get(in_q, stop)
+                if item is _DONE:
+                    break
+                try:
+                    result = stage.fn(resource, item) if stage.setup else stage.fn(item)
+                    results = (result if result is not None else ()) if stage.fan_out else (() if result is None else (result,))
+                    for r in results:
+                        if not _put(out_q, r, stop):
+                            break
+                    with lock:
+                        self.stats[stage.name]['processed'] += 1
+                except Exception as e:
+                    with lock:
+                        self.stats[stage.name]['errors'] += 1
+                    logging.error(f"❌ Stage {stage.name} failed on {item!r}: {e}")
+        except Exception as e:
+            # A worker that can't set up would leave upstream blocked, so stop the run
+            self._failure = f"Stage {stage.name} worker failed to start: {e}"
+            logging.error(f"❌ {self._failure}")
+            stop.set()
+        finally:
+            if stage.teardown and resource is not None:
+                try:
+                    stage.teardown(resource)
+                except Exception as e:
+                    logging.error(f"❌ Stage {stage.name} teardown failed: {e}")
+            # The last worker of a stage to finish closes the next queue
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                for _ in range(downstream_workers):
+                    _put(out_q, _DONE, stop)
+
+def _put(q, item, stop):
+    # Blocking put that gives up if the pipeline is being torn down
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(q, stop):
+    # Blocking get that returns _DONE if the pipeline is being torn down
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+def _drain(q):
+    try:
+        while True:
+            q.get_nowait()
+    except queue.Empty:
+        pass
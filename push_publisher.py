@@ -0,0 +1,49 @@
+import os
+import sys
+import json
+import base64
+import urllib.parse
+import urllib.request
+
+# Local stand-in for Pub/Sub: posts a Gmail push notification to the webhook
+# Usage: python push_publisher.py <email> <history_id> [webhook_url]
+# Sends PUSH_VERIFICATION_TOKEN as ?token=, the same way the Pub/Sub subscription should
+DEFAULT_URL = 'http://localhost:5000/gmail-push'
+
+def build_envelope(email, history_id, message_id='local-1'):
+    data = json.dumps({'emailAddress': email, 'historyId': int(history_id)})
+    return {
+        'message': {
+            'data': base64.b64encode(data.encode('utf-8')).decode('ascii'),
+            'messageId': message_id,
+            'attributes': {}
+        },
+        'subscription': 'projects/local/subscriptions/gmail-push'
+    }
+
+def publish(url, envelope):
+    req = urllib.request.Request(
+        url,
+        data=json.dumps(envelope).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST'
+    )
+    with urllib.request.urlopen(req) as resp:
+        return resp.status, resp.read().decode('utf-8')
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: python push_publisher.py <email> <history_id> [webhook_url]")
+        sys.exit(1)
+
+    email, history_id = sys.argv[1], sys.argv[2]
+    url = sys.argv[3] if len(sys.argv) > 3 else DEFAULT_URL
+    token = os.getenv("PUSH_VERIFICATION_TOKEN")
+    if token:
+        url += ('&' if '?' in url else '?') + urllib.parse.urlencode({'token': token})
+
+    status, body = publish(url, build_envelope(email, history_id))
+    print(f"📬 {status} {body}")
+
+if __name__ == '__main__':
+    main()
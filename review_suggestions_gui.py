@@ -1,98 +1,76 @@
-import json
-import os
 import tkinter as tk
 from tkinter import ttk, messagebox
+from rule_store import RuleFile, rule_key
+from rule_view import VirtualRuleTree
 
 RULES_FILE = "rules.json"
 SUGGESTED_FILE = "suggested_rules.json"
 DENIED_FILE = "denied_rules.json"
+RELOAD_INTERVAL_MS = 2000
 
-def load_json(path):
-    if not os.path.exists(path):
-        return []
-    with open(path, "r") as f:
-        return json.load(f)
-
-def save_json(path, data):
-    with open(path, "w") as f:
-        json.dump(data, f, indent=2)
-
-def rule_key(rule):
-    return f"{rule['type']}|{rule['contains']}|{rule['label']}"
-
-def accept_rule(rule):
-    rules = load_json(RULES_FILE)
-    key_set = {rule_key(r) for r in rules}
-    if rule_key(rule) not in key_set:
-        rules.append(rule)
-        save_json(RULES_FILE, rules)
-    remove_suggestion(rule)
-
-def deny_rule(rule):
-    denied = load_json(DENIED_FILE)
-    key_set = {rule_key(r) for r in denied}
-    if rule_key(rule) not in key_set:
-        denied.append(rule)
-        save_json(DENIED_FILE, denied)
-    remove_suggestion(rule)
-
-def remove_suggestion(rule):
-    suggestions = load_json(SUGGESTED_FILE)
-    filtered = [r for r in suggestions if rule_key(r) != rule_key(rule)]
-    save_json(SUGGESTED_FILE, filtered)
-    refresh_all()
+rules_store = RuleFile(RULES_FILE)
+suggested_store = RuleFile(SUGGESTED_FILE)
+denied_store = RuleFile(DENIED_FILE)
+
+def accept_rules(selected_rules):
+    for rule in selected_rules:
+        rules_store.add(rule)
+        suggested_store.remove(rule)
+    rules_store.commit()
+    suggested_store.commit()
+    suggested_tree.remove_rules(selected_rules)
+    clear_edit_fields()
+
+def deny_rules(selected_rules):
+    for rule in selected_rules:
+        denied_store.add(rule)
+        suggested_store.remove(rule)
+    denied_store.commit()
+    suggested_store.commit()
+    suggested_tree.remove_rules(selected_rules)
+    denied_tree.add_rules(selected_rules)
+    clear_edit_fields()
 
 def refresh_all():
     load_suggested_tab()
     load_denied_tab()
     clear_edit_fields()
 
-def load_suggested_tab():
-    for row in suggested_tree.get_children():
-        suggested_tree.delete(row)
-
-    suggestions = load_json(SUGGESTED_FILE)
-    denied = load_json(DENIED_FILE)
-    denied_keys = {rule_key(r) for r in denied}
+def visible_suggestions():
+    denied_keys = denied_store.keys()
+    return [rule for rule in suggested_store.rules() if rule_key(rule) not in denied_keys]
 
-    for rule in suggestions:
-        if rule_key(rule) not in denied_keys:
-            suggested_tree.insert("", "end", values=(rule["type"], rule["contains"], rule["label"]))
+def load_suggested_tab():
+    # Parsing and indexing happen on a worker thread; only visible rows hit the Treeview
+    suggested_tree.load(visible_suggestions)
 
 def load_denied_tab():
-    for row in denied_tree.get_children():
-        denied_tree.delete(row)
+    denied_tree.load(denied_store.rules)
 
-    denied = load_json(DENIED_FILE)
-    for rule in denied:
-        denied_tree.insert("", "end", values=(rule["type"], rule["contains"], rule["label"]))
-
-def get_selected_rules(tree):
-    selected = tree.selection()
-    rules = []
-    for row in selected:
-        values = tree.item(row)["values"]
-        rules.append({"type": values[0], "contains": values[1], "label": values[2]})
-    return rules
+def poll_for_changes():
+    # Pick up edits made by rule_suggester, merge_rules or another GUI
+    changed = [store.reload_if_changed() for store in (suggested_store, denied_store, rules_store)]
+    if changed[0] or changed[1]:
+        suggested_tree.set_rules(visible_suggestions())
+        denied_tree.set_rules(denied_store.rules())
+    root.after(RELOAD_INTERVAL_MS, poll_for_changes)
 
 def on_accept():
-    selected_rules = get_selected_rules(suggested_tree)
+    selected_rules = suggested_tree.selected_rules()
     if not selected_rules:
         messagebox.showinfo("Select Rule", "Please select one or more rules to accept.")
         return
-    for rule in selected_rules:
-        accept_rule(rule)
+    accept_rules(selected_rules)
 
 def on_deny():
-    selected_rules = get_selected_rules(suggested_tree)
+    selected_rules = suggested_tree.selected_rules()
     if not selected_rules:
         messagebox.showinfo("Select Rule", "Please select one or more rules to deny.")
         return
-    for rule in selected_rules:
-        deny_rule(rule)
+    deny_rules(selected_rules)
 
 def on_edit():
-    selected_rules = get_selected_rules(suggested_tree)
+    selected_rules = suggested_tree.selected_rules()
     if not selected_rules:
         messagebox.showinfo("Select Rule", "Please select a rule to edit.")
         return
@@ -121,17 +99,10 @@ def on_save_edit():
         messagebox.showerror("Missing Info", "Please fill out all fields.")
         return
 
-    suggestions = load_json(SUGGESTED_FILE)
-    updated = False
-    for i, r in enumerate(suggestions):
-        if rule_key(r) == rule_key(editing_rule):
-            suggestions[i] = edited_rule
-            updated = True
-            break
-
-    if updated:
-        save_json(SUGGESTED_FILE, suggestions)
-        refresh_all()
+    if suggested_store.replace(editing_rule, edited_rule):
+        suggested_store.commit()
+        suggested_tree.replace_rule(editing_rule, edited_rule)
+        clear_edit_fields()
     else:
         messagebox.showerror("Error", "Could not find the rule to update.")
 
@@ -152,14 +123,7 @@ notebook.pack(fill="both", expand=True, padx=10, pady=10)
 suggested_frame = ttk.Frame(notebook)
 notebook.add(suggested_frame, text="Suggested Rules")
 
-suggested_tree = ttk.Treeview(
-    suggested_frame,
-    columns=("Type", "Contains", "Label"),
-    show="headings",
-    selectmode="extended"  # multi-select enabled
-)
-for col in ("Type", "Contains", "Label"):
-    suggested_tree.heading(col, text=col)
+suggested_tree = VirtualRuleTree(suggested_frame, selectmode="extended")  # multi-select enabled
 suggested_tree.pack(fill="both", expand=True, pady=5)
 
 # Edit Fields
@@ -194,15 +158,9 @@ ttk.Button(btn_frame, text="❌ Deny Selected", command=on_deny).grid(row=0, col
 denied_frame = ttk.Frame(notebook)
 notebook.add(denied_frame, text="Denied Rules")
 
-denied_tree = ttk.Treeview(
-    denied_frame,
-    columns=("Type", "Contains", "Label"),
-    show="headings",
-    selectmode="browse"
-)
-for col in ("Type", "Contains", "Label"):
-    denied_tree.heading(col, text=col)
+denied_tree = VirtualRuleTree(denied_frame, selectmode="browse")
 denied_tree.pack(fill="both", expand=True, pady=5)
 
 refresh_all()
+root.after(RELOAD_INTERVAL_MS, poll_for_changes)
 root.mainloop()
@@ -0,0 +1,198 @@
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Shared model for rules.json, suggested_rules.json and denied_rules.json.
+# Rules are kept in memory keyed by rule_key, changes are batched and written
+# atomically (temp file + rename), and the file's mtime/size is used to notice
+# when another process (GUI, merge_rules, organizer) has rewritten it.
+
+def load_json(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_json(path, data):
+    # Write to a temp file in the same directory, then rename over the target so
+    # readers never see a half-written file
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+@contextmanager
+def file_lock(path):
+    # Advisory lock on a sidecar file, held across reload-and-write so two processes
+    # committing to the same rules file at once can't drop each other's changes
+    with open(path + '.lock', 'a+') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def rule_key(rule):
+    # A unique identifier for a rule (used for deduping)
+    return f"{rule['type']}|{rule['contains']}|{rule['label']}"
+
+def file_signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def compile_rules(rules):
+    # Pre-lowercase the patterns and split them by field so matching is one pass
+    compiled = {'from': [], 'subject': []}
+    for rule in rules:
+        field = 'from' if rule['type'] == 'from' else 'subject'
+        compiled[field].append((len(compiled['from']) + len(compiled['subject']), rule['contains'].lower(), rule['label']))
+    return compiled
+
+def match_compiled(compiled, sender, subject):
+    # First matching rule (in file order) wins; matching is a case-insensitive substring check
+    sender = (sender or '').lower()
+    subject = (subject or '').lower()
+    best = None
+    for order, pattern, label in compiled['from']:
+        if pattern in sender:
+            best = (order, label)
+            break
+    for order, pattern, label in compiled['subject']:
+        if best is not None and order > best[0]:
+            break
+        if pattern in subject:
+            best = (order, label)
+            break
+    return best[1] if best else None
+
+class RuleFile:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._rules = {}
+        self._pending = []
+        self._signature = None
+        self._compiled = None
+        self.reload()
+
+    def reload(self):
+        with self._lock:
+            signature = file_signature(self.path)
+            self._rules = {rule_key(r): r for r in load_json(self.path)}
+            self._signature = signature
+            self._compiled = None
+            for op in self._pending:
+                self._apply(op)
+
+    def reload_if_changed(self):
+        # Returns True if the file was rewritten by someone else since we last looked
+        with self._lock:
+            if file_signature(self.path) == self._signature:
+                return False
+            self.reload()
+            return True
+
+    def rules(self):
+        with self._lock:
+            return list(self._rules.values())
+
+    def keys(self):
+        with self._lock:
+            return set(self._rules)
+
+    def get(self, key):
+        with self._lock:
+            return self._rules.get(key)
+
+    def __contains__(self, rule):
+        with self._lock:
+            return rule_key(rule) in self._rules
+
+    def __len__(self):
+        with self._lock:
+            return len(self._rules)
+
+    def compiled(self):
+        # Compiled rule set is cached until the in-memory rules change
+        with self._lock:
+            if self._compiled is None:
+                self._compiled = compile_rules(self._rules.values())
+            return self._compiled
+
+    def add(self, rule):
+        return self._record(('add', dict(rule)))
+
+    def remove(self, rule):
+        return self._record(('remove', rule_key(rule)))
+
+    def replace(self, old_rule, new_rule):
+        return self._record(('replace', rule_key(old_rule), dict(new_rule)))
+
+    def _record(self, op):
+        with self._lock:
+            changed = self._apply(op)
+            if changed:
+                self._pending.append(op)
+                self._compiled = None
+            return changed
+
+    def _apply(self, op):
+        if op[0] == 'add':
+            key = rule_key(op[1])
+            if key in self._rules:
+                return False
+            self._rules[key] = op[1]
+            return True
+        if op[0] == 'remove':
+            return self._rules.pop(op[1], None) is not None
+        if op[0] == 'replace':
+            old_key, new_rule = op[1], op[2]
+            if old_key not in self._rules:
+                return False
+            # Rebuild to keep the edited rule in its original position
+            self._rules = {
+                (rule_key(new_rule) if k == old_key else k): (new_rule if k == old_key else r)
+                for k, r in self._rules.items()
+            }
+            return True
+        raise ValueError(f"Unknown rule operation: {op[0]}")
+
+    def commit(self):
+        # Write all pending changes in one atomic write. If another process changed
+        # the file since we loaded it, replay our changes on top of its version.
+        with self._lock, file_lock(self.path):
+            if not self._pending:
+                return False
+            if file_signature(self.path) != self._signature:
+                self.reload()
+            save_json(self.path, list(self._rules.values()))
+            self._signature = file_signature(self.path)
+            self._pending = []
+            return True
@@ -3,6 +3,7 @@ import os
 from collections import defaultdict, Counter
 import re
 from email.utils import parseaddr
+from rule_store import save_json
 
 EXAMPLES_FILE = 'labeled_examples.jsonl'
 SUGGESTED_FILE = 'suggested_rules.json'
@@ -76,8 +77,7 @@ def generate_suggestions(examples, min_count=2):
     return suggestions
 
 def save_suggestions(suggestions):
-    with open(SUGGESTED_FILE, 'w') as f:
-        json.dump(suggestions, f, indent=2)
+    save_json(SUGGESTED_FILE, suggestions)
     print(f"{len(suggestions)} smart rule suggestions saved to {SUGGESTED_FILE}")
 
 def main():
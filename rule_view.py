@@ -0,0 +1,382 @@
+import queue
+import threading
+import tkinter as tk
+from tkinter import ttk
+from rule_store import rule_key
+
+# Virtualized, searchable rule list for the Tk GUIs.
+# Only the rows that fit on screen are ever inserted into the Treeview; the full
+# list lives in a RuleIndex. Loading and filtering run on a worker thread and hand
+# results back to Tk through a queue polled with after().
+
+COLUMNS = ("Type", "Contains", "Label")
+NGRAM_SIZE = 3
+POLL_MS = 50
+DEFAULT_ROW_HEIGHT = 20
+HEADER_HEIGHT = 25
+EXTEND_MASK = 0x0001 | 0x0004  # Shift or Control held
+
+def ngrams(text, n):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+def search_text(rule):
+    return f"{rule['contains']}\n{rule['label']}".lower()
+
+class RuleIndex:
+    # Substring index over 'contains' and 'label'. Every 1-, 2- and 3-gram points at
+    # the rules containing it, so short queries are a single lookup and longer ones
+    # intersect their trigrams and then verify.
+    def __init__(self, rules=()):
+        self._lock = threading.Lock()
+        self._rules = {}
+        self._order = {}
+        self._text = {}
+        self._postings = {}
+        self._next_order = 0
+        for rule in rules:
+            self.add(rule)
+
+    def add(self, rule, order=None):
+        key = rule_key(rule)
+        with self._lock:
+            if key in self._rules:
+                return False
+            if order is None:
+                order = self._next_order
+                self._next_order += 1
+            text = search_text(rule)
+            self._rules[key] = rule
+            self._order[key] = order
+            self._text[key] = text
+            for n in range(1, NGRAM_SIZE + 1):
+                for gram in ngrams(text, n):
+                    self._postings.setdefault(gram, set()).add(key)
+            return True
+
+    def remove(self, key):
+        with self._lock:
+            if key not in self._rules:
+                return None
+            text = self._text.pop(key)
+            for n in range(1, NGRAM_SIZE + 1):
+                for gram in ngrams(text, n):
+                    bucket = self._postings.get(gram)
+                    if bucket is not None:
+                        bucket.discard(key)
+                        if not bucket:
+                            del self._postings[gram]
+            del self._rules[key]
+            return self._order.pop(key)
+
+    def replace(self, old_key, new_rule):
+        # Keep the edited rule where the old one was
+        order = self.remove(old_key)
+        if order is None:
+            return False
+        return self.add(new_rule, order=order)
+
+    def get(self, key):
+        with self._lock:
+            return self._rules.get(key)
+
+    def keys(self):
+        with self._lock:
+            return set(self._rules)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._rules)
+
+    def sorted_keys(self, keys):
+        with self._lock:
+            return sorted((k for k in keys if k in self._order), key=self._order.__getitem__)
+
+    def search(self, query, within=None):
+        # within: a previous result set to narrow, when the query only grew
+        query = query.lower()
+        with self._lock:
+            if not query:
+                candidates = set(self._rules)
+            elif within is not None:
+                candidates = {k for k in within if k in self._text and query in self._text[k]}
+            elif len(query) <= NGRAM_SIZE:
+                candidates = set(self._postings.get(query, ()))
+            else:
+                grams = sorted((self._postings.get(g, set()) for g in ngrams(query, NGRAM_SIZE)), key=len)
+                candidates = set(grams[0]).intersection(*grams[1:])
+                candidates = {k for k in candidates if query in self._text[k]}
+            return sorted(candidates, key=self._order.__getitem__)
+
+class VirtualRuleTree(ttk.Frame):
+    def __init__(self, parent, selectmode="extended", searchable=True):
+        super().__init__(parent)
+        self.index = RuleIndex()
+        self.view_keys = []
+        self.selected = set()
+        self.offset = 0
+        self.visible_rows = 20
+        self.query = ""
+        self._last_query = ""
+        self._last_result = None
+        self._generation = 0
+        self._iids = {}
+        self._next_iid = 0
+        self._extend = False
+        self._user_action = False
+        self._rendered_selection = set()
+        self._results = queue.Queue()
+
+        self.search_var = tk.StringVar()
+        if searchable:
+            search_frame = ttk.Frame(self)
+            search_frame.pack(fill="x", pady=(0, 5))
+            ttk.Label(search_frame, text="Search:").pack(side="left", padx=(0, 5))
+            ttk.Entry(search_frame, textvariable=self.search_var).pack(side="left", fill="x", expand=True)
+            self.count_label = ttk.Label(search_frame, text="")
+            self.count_label.pack(side="left", padx=5)
+            self.search_var.trace_add("write", lambda *args: self.set_query(self.search_var.get()))
+        else:
+            self.count_label = None
+
+        body = ttk.Frame(self)
+        body.pack(fill="both", expand=True)
+        self.tree = ttk.Treeview(body, columns=COLUMNS, show="headings", selectmode=selectmode)
+        for col in COLUMNS:
+            self.tree.heading(col, text=col)
+        self.scrollbar = ttk.Scrollbar(body, orient="vertical", command=self._on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<ButtonPress-1>", self._note_modifiers)
+        self.tree.bind("<KeyPress>", self._note_modifiers, add="+")
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1))
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-1))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(1))
+        self.tree.bind("<Up>", lambda e: self._on_arrow(e, -1))
+        self.tree.bind("<Down>", lambda e: self._on_arrow(e, 1))
+        self.tree.bind("<Prior>", lambda e: self.scroll(-self.visible_rows))
+        self.tree.bind("<Next>", lambda e: self.scroll(self.visible_rows))
+
+        self.after(POLL_MS, self._poll_results)
+
+    # --- Loading and filtering (worker thread) ---
+
+    def load(self, loader):
+        # loader runs on a worker thread and returns the full list of rules
+        self._generation += 1
+        generation = self._generation
+
+        def work():
+            rules = loader()
+            index = RuleIndex(rules)
+            self._results.put(("loaded", generation, index))
+
+        threading.Thread(target=work, daemon=True).start()
+
+    def set_query(self, query):
+        self.query = query
+        self._generation += 1
+        generation = self._generation
+        within = None
+        if self._last_result is not None and self._last_query and self._last_query in query:
+            within = self._last_result
+
+        def work():
+            result = self.index.search(query, within=within)
+            self._results.put(("filtered", generation, (query, result)))
+
+        threading.Thread(target=work, daemon=True).start()
+
+    def _poll_results(self):
+        try:
+            while True:
+                kind, generation, payload = self._results.get_nowait()
+                if generation != self._generation:
+                    continue
+                if kind == "loaded":
+                    self.index = payload
+                    self._last_result = None
+                    self.selected &= self.index.keys()
+                    self.set_query(self.query)
+                elif kind == "filtered":
+                    query, result = payload
+                    self._last_query, self._last_result = query, set(result)
+                    self._show(result)
+        except queue.Empty:
+            pass
+        finally:
+            # Always reschedule, or one bad result would stop the widget updating for good
+            self.after(POLL_MS, self._poll_results)
+
+    # --- Diff-based updates (main thread) ---
+
+    def set_rules(self, rules):
+        # Bring the list in line with `rules`, touching only what changed
+        new = {rule_key(r): r for r in rules}
+        current = self.index.keys()
+        removed = current - set(new)
+        added = [r for k, r in new.items() if k not in current]
+        if not removed and not added:
+            return
+        for key in removed:
+            self.index.remove(key)
+        for rule in added:
+            self.index.add(rule)
+        self.selected -= removed
+        self._refresh_view()
+
+    def add_rules(self, rules):
+        if any([self.index.add(r) for r in rules]):
+            self._refresh_view()
+
+    def remove_rules(self, rules):
+        keys = {rule_key(r) for r in rules}
+        for key in keys:
+            self.index.remove(key)
+        self.selected -= keys
+        self._refresh_view()
+
+    def replace_rule(self, old_rule, new_rule):
+        old_key = rule_key(old_rule)
+        if self.index.replace(old_key, new_rule):
+            if old_key in self.selected:
+                self.selected.discard(old_key)
+                self.selected.add(rule_key(new_rule))
+            self._refresh_view()
+
+    def _refresh_view(self):
+        self._last_result = None
+        if self.query:
+            self.set_query(self.query)
+        else:
+            # Invalidate any filter still in flight; it was computed before this change
+            self._generation += 1
+            self._show(self.index.search(""))
+
+    def _show(self, keys):
+        # Rows hidden by the filter can't stay selected, or actions would hit rules the user can't see
+        self.view_keys = keys
+        self.selected &= set(keys)
+        self._render()
+
+    # --- Selection ---
+
+    def selected_rules(self):
+        return [self.index.get(k) for k in self.index.sorted_keys(self.selected)]
+
+    def focused_rule(self):
+        # The row the user last clicked, falling back to the first selected rule
+        iid_to_key = {iid: key for key, iid in self._iids.items()}
+        key = iid_to_key.get(self.tree.focus())
+        if key in self.selected:
+            return self.index.get(key)
+        rules = self.selected_rules()
+        return rules[0] if rules else None
+
+    def clear_selection(self):
+        self.selected.clear()
+        self._rendered_selection = set()
+        self.tree.selection_set(())
+
+    def _note_modifiers(self, event):
+        self._extend = bool(event.state & EXTEND_MASK)
+        self._user_action = True
+
+    def _on_select(self, event=None):
+        selection = set(self.tree.selection())
+        if not self._user_action and selection == self._rendered_selection:
+            # Echo of our own selection_set in _render, not a user action
+            return
+        self._user_action = False
+        window = set(self._window_keys())
+        iid_to_key = {iid: key for key, iid in self._iids.items()}
+        now = {iid_to_key[iid] for iid in selection if iid in iid_to_key}
+        if self._extend:
+            # Ctrl/Shift: keep what's selected off screen
+            self.selected = (self.selected - window) | now
+        else:
+            self.selected = now
+        self._rendered_selection = selection
+
+    # --- Windowed rendering ---
+
+    def _window_keys(self):
+        return self.view_keys[self.offset:self.offset + self.visible_rows]
+
+    def _iid_for(self, key):
+        if key not in self._iids:
+            self._iids[key] = str(self._next_iid)
+            self._next_iid += 1
+        return self._iids[key]
+
+    def _render(self):
+        max_offset = max(0, len(self.view_keys) - self.visible_rows)
+        self.offset = min(max(0, self.offset), max_offset)
+        window = self._window_keys()
+
+        wanted = {self._iid_for(k): k for k in window if self.index.get(k) is not None}
+        for iid in self.tree.get_children():
+            if iid not in wanted:
+                self.tree.delete(iid)
+        self._iids = {k: iid for iid, k in wanted.items()}
+
+        for position, (iid, key) in enumerate(wanted.items()):
+            rule = self.index.get(key)
+            values = (rule["type"], rule["contains"], rule["label"])
+            if self.tree.exists(iid):
+                self.tree.move(iid, "", position)
+            else:
+                self.tree.insert("", position, iid=iid, values=values)
+        self._rendered_selection = {iid for iid, k in wanted.items() if k in self.selected}
+        self.tree.selection_set(list(self._rendered_selection))
+
+        total = len(self.view_keys)
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + len(window)) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        if self.count_label is not None:
+            self.count_label.configure(text=f"{total} of {len(self.index)}")
+
+    def scroll(self, rows):
+        self.offset += rows
+        self._render()
+        return "break"
+
+    def _on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            self.offset = int(float(args[1]) * len(self.view_keys))
+        elif args[0] == "scroll":
+            step = int(args[1])
+            self.offset += step * self.visible_rows if args[2] == "pages" else step
+        self._render()
+
+    def _on_arrow(self, event, step):
+        # Let Tk move the focus inside the window; scroll when stepping past an edge
+        self._note_modifiers(event)
+        children = self.tree.get_children()
+        if not children:
+            return None
+        edge = children[-1] if step > 0 else children[0]
+        if self.tree.focus() != edge:
+            return None
+        before = self.offset
+        self.scroll(step)
+        if self.offset != before:
+            children = self.tree.get_children()
+            target = children[-1] if step > 0 else children[0]
+            self.tree.focus(target)
+            self.tree.selection_set(target)
+        return "break"
+
+    def _on_resize(self, event):
+        try:
+            row_height = int(ttk.Style().lookup("Treeview", "rowheight") or DEFAULT_ROW_HEIGHT)
+        except (tk.TclError, ValueError):
+            row_height = DEFAULT_ROW_HEIGHT
+        rows = max(1, (event.height - HEADER_HEIGHT) // row_height)
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self._render()
@@ -1,24 +1,20 @@
-import json
-import os
 import tkinter as tk
 from tkinter import ttk, messagebox
+from rule_store import RuleFile
+from rule_view import VirtualRuleTree
 
 RULES_FILE = 'rules.json'
-
-def load_rules():
-    if os.path.exists(RULES_FILE):
-        with open(RULES_FILE, 'r') as f:
-            return json.load(f)
-    return []
-
-def save_rules(rules):
-    with open(RULES_FILE, 'w') as f:
-        json.dump(rules, f, indent=2)
+RELOAD_INTERVAL_MS = 2000
 
 def update_rule_list():
-    rule_tree.delete(*rule_tree.get_children())
-    for i, rule in enumerate(rules):
-        rule_tree.insert("", "end", iid=str(i), values=(rule["type"], rule["contains"], rule["label"]))
+    # Reads and indexes rules.json on a worker thread; only visible rows are inserted
+    rule_tree.load(rules_store.rules)
+
+def poll_for_changes():
+    # Pick up rules merged or accepted from other tools while this window is open
+    if rules_store.reload_if_changed():
+        rule_tree.set_rules(rules_store.rules())
+    root.after(RELOAD_INTERVAL_MS, poll_for_changes)
 
 def add_rule():
     rule_type = type_var.get()
@@ -31,63 +27,60 @@ def add_rule():
 
     new_rule = {"type": rule_type, "contains": contains, "label": label}
     
-    if editing_index.get() is not None:
+    if editing_rule:
         # Edit existing rule
-        index = editing_index.get()
-        rules[index] = new_rule
-        editing_index.set(None)
+        rules_store.replace(editing_rule, new_rule)
+        rule_tree.replace_rule(editing_rule, new_rule)
+        editing_rule.clear()
     else:
         # Add new rule
-        rules.append(new_rule)
+        rules_store.add(new_rule)
+        rule_tree.add_rules([new_rule])
 
-    save_rules(rules)
-    update_rule_list()
+    rules_store.commit()
     contains_entry.delete(0, tk.END)
     label_entry.delete(0, tk.END)
 
 def delete_rule():
-    selected_items = rule_tree.selection()
-    if not selected_items:
+    selected_rules = rule_tree.selected_rules()
+    if not selected_rules:
         messagebox.showinfo("Select Rule", "Please select one or more rules to delete.")
         return
 
-    confirm = messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete {len(selected_items)} rule(s)?")
+    confirm = messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete {len(selected_rules)} rule(s)?")
     if not confirm:
         return
 
-    # Convert to int and sort in reverse so deleting doesn't mess up indexes
-    indexes = sorted([int(i) for i in selected_items], reverse=True)
-    for index in indexes:
-        del rules[index]
+    for rule in selected_rules:
+        rules_store.remove(rule)
 
-    save_rules(rules)
-    update_rule_list()
+    rules_store.commit()
+    rule_tree.remove_rules(selected_rules)
     contains_entry.delete(0, tk.END)
     label_entry.delete(0, tk.END)
-    editing_index.set(None)
+    editing_rule.clear()
 
 def edit_rule():
-    selected = rule_tree.selection()
-    if not selected:
+    rule = rule_tree.focused_rule()
+    if not rule:
         messagebox.showinfo("Select Rule", "Please select a rule to edit.")
         return
-    index = int(selected[0])
-    rule = rules[index]
     type_var.set(rule["type"])
     contains_entry.delete(0, tk.END)
     contains_entry.insert(0, rule["contains"])
     label_entry.delete(0, tk.END)
     label_entry.insert(0, rule["label"])
-    editing_index.set(index)
+    editing_rule.clear()
+    editing_rule.update(rule)
 
 # Load rules
-rules = load_rules()
+rules_store = RuleFile(RULES_FILE)
 
 # GUI Setup
 root = tk.Tk()
 root.title("Gmail Organizer Rule Manager")
 
-editing_index = tk.IntVar(value=None)
+editing_rule = {}
 
 frame = tk.Frame(root)
 frame.pack(padx=10, pady=10)
@@ -112,11 +105,9 @@ tk.Button(button_frame, text="Add / Save Rule", command=add_rule).grid(row=0, co
 tk.Button(button_frame, text="Edit Selected", command=edit_rule).grid(row=0, column=1, padx=5)
 tk.Button(button_frame, text="Delete Selected", command=delete_rule).grid(row=0, column=2, padx=5)
 
-rule_tree = ttk.Treeview(root, columns=("Type", "Contains", "Label"), show="headings", selectmode="extended")
-rule_tree.heading("Type", text="Type")
-rule_tree.heading("Contains", text="Contains")
-rule_tree.heading("Label", text="Label")
+rule_tree = VirtualRuleTree(root, selectmode="extended")
 rule_tree.pack(padx=10, pady=10, fill="both", expand=True)
 
 update_rule_list()
+root.after(RELOAD_INTERVAL_MS, poll_for_changes)
 root.mainloop()
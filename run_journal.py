@@ -0,0 +1,188 @@
+import sqlite3
+import threading
+import time
+
+# Durable journal for organizer runs. Every (message ID, label) action is recorded
+# as planned before it is applied and as committed once Gmail accepted it, in
+# batches. A run that is killed partway through is picked up again by the next
+# run with the same name, which skips everything already committed. A run that
+# finishes with actions that failed to apply hands them to the next run, which
+# retries them up to MAX_ATTEMPTS times before marking them failed.
+
+JOURNAL_DB = 'organizer_runs.db'
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 3
+
+PLANNED = 'planned'
+COMMITTED = 'committed'
+SKIPPED = 'skipped'  # looked at, no rule matched
+FAILED = 'failed'    # gave up after MAX_ATTEMPTS failed applies
+
+def open_journal_db(db_path=JOURNAL_DB):
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            status TEXT,
+            planning_done INTEGER DEFAULT 0,
+            started_at REAL,
+            updated_at REAL,
+            finished_at REAL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS run_actions (
+            run_id INTEGER,
+            msg_id TEXT,
+            label TEXT,
+            state TEXT,
+            updated_at REAL,
+            attempts INTEGER DEFAULT 0,
+            PRIMARY KEY (run_id, msg_id)
+        )
+    ''')
+    # Journals created before attempts were tracked
+    if 'attempts' not in [r[1] for r in conn.execute("PRAGMA table_info(run_actions)")]:
+        conn.execute("ALTER TABLE run_actions ADD COLUMN attempts INTEGER DEFAULT 0")
+    conn.commit()
+    return conn
+
+class RunJournal:
+    def __init__(self, name, db_path=JOURNAL_DB, batch_size=BATCH_SIZE):
+        self.name = name
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._buffer = []
+        self.conn = open_journal_db(db_path)
+
+        row = self.conn.execute(
+            "SELECT id, planning_done FROM runs WHERE name = ? AND status = 'running' ORDER BY id DESC LIMIT 1",
+            (name,)
+        ).fetchone()
+        now = time.time()
+        if row:
+            self.run_id, self.planning_done = row[0], bool(row[1])
+            self.resumed = True
+        else:
+            c = self.conn.execute(
+                "INSERT INTO runs (name, status, started_at, updated_at) VALUES (?, 'running', ?, ?)",
+                (name, now, now)
+            )
+            self.run_id, self.planning_done = c.lastrowid, False
+            self.resumed = False
+            # Take over actions a finished run couldn't apply; they come back from pending()
+            self.conn.execute(
+                "UPDATE run_actions SET run_id = ? WHERE state = ? AND run_id IN (SELECT id FROM runs WHERE name = ? AND status = 'finished')",
+                (self.run_id, PLANNED, name)
+            )
+            self.conn.commit()
+
+        self._seen = {r[0] for r in self.conn.execute("SELECT msg_id FROM run_actions WHERE run_id = ?", (self.run_id,))}
+
+    def seen(self, msg_id):
+        # True if this run already planned, skipped or committed the message
+        with self._lock:
+            return msg_id in self._seen
+
+    def plan(self, msg_id, label):
+        self._record(msg_id, label, PLANNED if label else SKIPPED)
+
+    def commit(self, msg_id, label):
+        self._record(msg_id, label, COMMITTED)
+
+    def fail(self, msg_id, label):
+        # A failed apply stays planned for a retry until it has used up MAX_ATTEMPTS
+        self.flush()
+        with self._lock:
+            self.conn.execute(
+                "UPDATE run_actions SET attempts = attempts + 1, state = CASE WHEN attempts + 1 >= ? THEN ? ELSE state END, updated_at = ? WHERE run_id = ? AND msg_id = ? AND state = ?",
+                (MAX_ATTEMPTS, FAILED, time.time(), self.run_id, msg_id, PLANNED)
+            )
+            self.conn.commit()
+
+    def _record(self, msg_id, label, state):
+        with self._lock:
+            self._seen.add(msg_id)
+            self._buffer.append((self.run_id, msg_id, label, state, time.time()))
+            if len(self._buffer) >= self.batch_size:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        self.conn.executemany(
+            "REPLACE INTO run_actions (run_id, msg_id, label, state, updated_at) VALUES (?, ?, ?, ?, ?)",
+            self._buffer
+        )
+        self.conn.execute("UPDATE runs SET updated_at = ? WHERE id = ?", (time.time(), self.run_id))
+        self.conn.commit()
+        self._buffer = []
+
+    def pending(self):
+        # Planned actions that never made it to committed (e.g. the last run was killed)
+        self.flush()
+        with self._lock:
+            return self.conn.execute(
+                "SELECT msg_id, label FROM run_actions WHERE run_id = ? AND state = ?",
+                (self.run_id, PLANNED)
+            ).fetchall()
+
+    def mark_planning_done(self):
+        self.flush()
+        with self._lock:
+            self.planning_done = True
+            self.conn.execute("UPDATE runs SET planning_done = 1, updated_at = ? WHERE id = ?", (time.time(), self.run_id))
+            self.conn.commit()
+
+    def finish(self):
+        self.flush()
+        with self._lock:
+            now = time.time()
+            self.conn.execute("UPDATE runs SET status = 'finished', updated_at = ?, finished_at = ? WHERE id = ?", (now, now, self.run_id))
+            self.conn.commit()
+
+    def progress(self):
+        self.flush()
+        with self._lock:
+            return run_progress(self.conn, self.run_id)
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+def run_progress(conn, run_id):
+    run = conn.execute(
+        "SELECT id, name, status, planning_done, started_at, updated_at, finished_at FROM runs WHERE id = ?",
+        (run_id,)
+    ).fetchone()
+    if not run:
+        return None
+    counts = dict(conn.execute(
+        "SELECT state, COUNT(*) FROM run_actions WHERE run_id = ? GROUP BY state", (run_id,)
+    ).fetchall())
+    return {
+        'run_id': run[0],
+        'name': run[1],
+        'status': run[2],
+        'planning_done': bool(run[3]),
+        'started_at': run[4],
+        'updated_at': run[5],
+        'finished_at': run[6],
+        'planned': counts.get(PLANNED, 0),
+        'committed': counts.get(COMMITTED, 0),
+        'skipped': counts.get(SKIPPED, 0),
+        'failed': counts.get(FAILED, 0)
+    }
+
+def recent_runs(db_path=JOURNAL_DB, limit=10):
+    conn = open_journal_db(db_path)
+    run_ids = [r[0] for r in conn.execute("SELECT id FROM runs ORDER BY id DESC LIMIT ?", (limit,))]
+    runs = [run_progress(conn, run_id) for run_id in run_ids]
+    conn.close()
+    return runs
@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+# Cold/warm startup benchmark for the organizer entry points.
+#   python startup_bench.py                       # import gmail_connect / app, run --startup-check
+#   python startup_bench.py --exe dist/gmail_connect/gmail_connect
+# "cold" runs each launch with an empty bytecode cache (PYTHONPYCACHEPREFIX in a fresh
+# temp dir), so modules are compiled from source; "warm" reuses one cache. The OS
+# file cache isn't dropped, so the first packaged launch after boot will be slower.
+
+RUNS = 5
+
+# app.py refuses to import without these; the values are never used at import time
+APP_ENV = {
+    'GOOGLE_CREDENTIALS_JSON': '{"web": {}}',
+    'REDIRECT_URI': 'http://localhost/oauth2callback'
+}
+
+TARGETS = {
+    'import gmail_connect': [sys.executable, '-c', 'import gmail_connect'],
+    'import app': [sys.executable, '-c', 'import app'],
+    'gmail_connect --startup-check': [sys.executable, 'gmail_connect.py', '--startup-check'],
+}
+
+def time_launch(cmd, env):
+    start = time.perf_counter()
+    subprocess.run(cmd, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+def bench(cmd, runs):
+    env = dict(os.environ, **APP_ENV)
+    cold, warm = [], []
+
+    for _ in range(runs):
+        cache_dir = tempfile.mkdtemp(prefix='pycache-')
+        try:
+            cold.append(time_launch(cmd, dict(env, PYTHONPYCACHEPREFIX=cache_dir)))
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    cache_dir = tempfile.mkdtemp(prefix='pycache-')
+    try:
+        warm_env = dict(env, PYTHONPYCACHEPREFIX=cache_dir)
+        time_launch(cmd, warm_env)
+        for _ in range(runs):
+            warm.append(time_launch(cmd, warm_env))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return cold, warm
+
+def summary(samples):
+    return f"min {min(samples) * 1000:7.1f} ms  median {statistics.median(samples) * 1000:7.1f} ms"
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold and warm startup time")
+    parser.add_argument('--runs', type=int, default=RUNS)
+    parser.add_argument('--exe', help="Packaged organizer to time with --startup-check")
+    args = parser.parse_args()
+
+    targets = dict(TARGETS)
+    if args.exe:
+        # A frozen executable ignores the bytecode cache; cold vs warm there is onefile
+        # extraction and OS caching, not compilation
+        targets[f"{args.exe} --startup-check"] = [args.exe, '--startup-check']
+
+    for name, cmd in targets.items():
+        try:
+            cold, warm = bench(cmd, args.runs)
+        except subprocess.CalledProcessError as e:
+            print(f"❌ {name}: exited with {e.returncode}")
+            continue
+        print(f"⏱️  {name}")
+        print(f"    cold  {summary(cold)}")
+        print(f"    warm  {summary(warm)}")
+
+if __name__ == '__main__':
+    main()
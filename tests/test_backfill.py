@@ -0,0 +1,138 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import backfill
+from rule_store import compile_rules
+from run_journal import RunJournal, MAX_ATTEMPTS
+
+
+class FakeRequest:
+    def __init__(self, fn):
+        self.fn = fn
+
+    def execute(self):
+        return self.fn()
+
+
+class FakeGmail:
+    # messages().list/get/batchModify and labels().list for the backfill
+    def __init__(self, mailbox, deleted=()):
+        self.mailbox = dict(mailbox)  # msg_id -> (from, subject)
+        self.deleted = set(deleted)
+        self.fetched = []
+        self.labeled = {}
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def labels(self):
+        return SimpleNamespace(list=lambda userId: FakeRequest(lambda: {'labels': [{'name': '@News', 'id': 'Label_1'}]}))
+
+    def list(self, userId, labelIds=None, q=None, pageToken=None, maxResults=None):
+        ids = sorted(self.mailbox)
+        return FakeRequest(lambda: {'messages': [{'id': i} for i in ids]})
+
+    def get(self, userId, id, format=None, metadataHeaders=None):
+        def run():
+            self.fetched.append(id)
+            sender, subject = self.mailbox[id]
+            return {'payload': {'headers': [{'name': 'From', 'value': sender}, {'name': 'Subject', 'value': subject}]}}
+        return FakeRequest(run)
+
+    def batchModify(self, userId, body):
+        def run():
+            if self.deleted & set(body['ids']):
+                error = IOError("Invalid id value")
+                error.resp = SimpleNamespace(status=400)
+                raise error
+            for msg_id in body['ids']:
+                self.labeled[msg_id] = body['addLabelIds'][0]
+            return {}
+        return FakeRequest(run)
+
+
+def write_snapshot(path, count, tail=''):
+    with open(path, 'w') as f:
+        for i in range(count):
+            f.write(json.dumps({'id': f'm{i}', 'from': f'user{i}@example.com', 'subject': 'x' * (i % 7)}) + '\n')
+        f.write(tail)
+
+
+@pytest.mark.parametrize('shard_count', [1, 3, 7, 50])
+def test_shards_cover_every_line_exactly_once(tmp_path, monkeypatch, shard_count):
+    path = str(tmp_path / 'mailbox.jsonl')
+    write_snapshot(path, 40, tail='{"id": "partial", "fro')
+    monkeypatch.setattr(backfill, '_classifier', {'rules': {'from': [], 'subject': []}, 'examples': {
+        'sender': {}, 'fingerprint': {}, 'domain': {'example': '@Example'}
+    }})
+
+    total = 0
+    ids = []
+    for shard in backfill.make_shards(path, shard_count):
+        processed, matches = backfill.classify_shard(shard)
+        total += processed
+        ids += [msg_id for msg_id, _ in matches]
+
+    assert total == 40
+    assert sorted(ids) == sorted(f'm{i}' for i in range(40))
+
+
+def test_classify_prefers_rules_then_sender_then_subject_then_domain():
+    classifier = {
+        'rules': compile_rules([{'type': 'subject', 'contains': 'invoice', 'label': '@Rule'}]),
+        'examples': backfill.build_example_index([
+            {'from': 'Bob <bob@shop.com>', 'subject': 'hello', 'label': '@Sender'},
+            {'from': 'x@other.com', 'subject': 'Order 123 shipped', 'label': '@Subject'},
+            {'from': 'y@shop.com', 'subject': 'sale', 'label': '@Sender'},
+        ])
+    }
+
+    assert backfill.classify(classifier, 'bob@shop.com', 'Your invoice') == '@Rule'
+    assert backfill.classify(classifier, 'bob@shop.com', 'Order 9 shipped') == '@Sender'
+    assert backfill.classify(classifier, 'ann@shop.com', 'Order 9 shipped') == '@Subject'
+    assert backfill.classify(classifier, 'ann@shop.com', 'news') == '@Sender'
+    assert backfill.classify(classifier, 'ann@gmail.com', 'news') is None
+
+
+def test_label_batches_groups_by_label_and_limit(monkeypatch):
+    monkeypatch.setattr(backfill, 'BATCH_MODIFY_LIMIT', 2)
+    actions = [('m1', '@A'), ('m2', '@B'), ('m3', '@A'), ('m4', '@A')]
+
+    assert list(backfill.label_batches(actions)) == [('@A', ['m1', 'm3']), ('@A', ['m4']), ('@B', ['m2'])]
+
+
+def test_snapshot_resumes_after_a_partial_last_line(tmp_path):
+    path = str(tmp_path / 'mailbox.jsonl')
+    write_snapshot(path, 2, tail='{"id": "m2", "from": "us')
+    gmail = FakeGmail({f'm{i}': (f'user{i}@example.com', 'hi') for i in range(4)})
+
+    assert backfill.snapshot(gmail, path) == 0
+
+    assert sorted(gmail.fetched) == ['m2', 'm3']
+    with open(path) as f:
+        assert sorted(json.loads(line)['id'] for line in f) == ['m0', 'm1', 'm2', 'm3']
+
+
+def test_failed_batch_only_fails_the_bad_ids(tmp_path):
+    gmail = FakeGmail({}, deleted={'m3'})
+    db_path = str(tmp_path / 'runs.db')
+
+    for attempt in range(MAX_ATTEMPTS):
+        journal = RunJournal('backfill', db_path)
+        if attempt == 0:
+            for i in range(6):
+                journal.plan(f'm{i}', '@News')
+            journal.mark_planning_done()
+        backfill.apply_backfill(gmail, journal)
+        progress = journal.progress()
+        journal.close()
+
+    assert sorted(gmail.labeled) == ['m0', 'm1', 'm2', 'm4', 'm5']
+    assert progress['committed'] == 5
+    assert progress['failed'] == 1
+    assert progress['status'] == 'finished'
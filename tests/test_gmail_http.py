@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+import pytest
+
+import gmail_http
+
+
+class FakeHttp:
+    def __init__(self, credentials, pool_size=None):
+        self.credentials = credentials
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def services(monkeypatch):
+    monkeypatch.setattr(gmail_http, 'PooledHttp', FakeHttp)
+    monkeypatch.setattr(gmail_http, 'build_service', lambda http: SimpleNamespace(http=http))
+    monkeypatch.setattr(gmail_http, '_services', gmail_http.OrderedDict())
+    return gmail_http._services
+
+
+def creds(refresh_token):
+    return SimpleNamespace(refresh_token=refresh_token, client_id='client', scopes=['gmail.modify'])
+
+
+def test_account_service_is_reused_until_credentials_change(services):
+    first = gmail_http.account_service('a@example.com', creds('r1'))
+    assert gmail_http.account_service('a@example.com', creds('r1')) is first
+
+    second = gmail_http.account_service('a@example.com', creds('r2'))
+    assert second is not first
+    assert first.http.closed
+    assert not second.http.closed
+
+
+def test_least_recently_used_account_is_evicted_and_closed(services, monkeypatch):
+    monkeypatch.setattr(gmail_http, 'MAX_CACHED_SERVICES', 2)
+    a = gmail_http.account_service('a@example.com', creds('r'))
+    b = gmail_http.account_service('b@example.com', creds('r'))
+    gmail_http.account_service('a@example.com', creds('r'))
+    gmail_http.account_service('c@example.com', creds('r'))
+
+    assert list(services) == ['a@example.com', 'c@example.com']
+    assert b.http.closed
+    assert not a.http.closed
+
+    gmail_http.forget_account_service('a@example.com')
+    assert a.http.closed
+    assert list(services) == ['c@example.com']
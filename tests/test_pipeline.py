@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+from pipeline import Pipeline, Stage
+
+
+def test_outputs_every_item_through_all_stages():
+    pipeline = Pipeline([
+        Stage('double', lambda x: x * 2, workers=4),
+        Stage('odd-only', lambda x: x if x % 4 else None),
+    ])
+
+    assert sorted(pipeline.run(range(10))) == [2, 6, 10, 14, 18]
+    assert pipeline.stats['double'] == {'processed': 10, 'errors': 0}
+
+
+def test_item_errors_are_counted_and_dropped():
+    def parse(x):
+        if x == 3:
+            raise ValueError("bad item")
+        return x
+
+    pipeline = Pipeline([Stage('parse', parse, workers=2)])
+
+    assert sorted(pipeline.run(range(5))) == [0, 1, 2, 4]
+    assert pipeline.stats['parse'] == {'processed': 4, 'errors': 1}
+
+
+def test_source_failure_raises_instead_of_ending_early():
+    def source():
+        yield 1
+        yield 2
+        raise ConnectionError("page 2 failed")
+
+    pipeline = Pipeline([Stage('echo', lambda x: x, workers=2)])
+
+    with pytest.raises(RuntimeError, match="page 2 failed"):
+        pipeline.run(source())
+
+
+def test_setup_failure_raises_and_tears_down_started_workers():
+    started = []
+    closed = []
+    lock = threading.Lock()
+
+    def setup():
+        with lock:
+            started.append(len(started))
+            if len(started) == 2:
+                raise OSError("no connection")
+            return started[-1]
+
+    pipeline = Pipeline([
+        Stage('write', lambda conn, x: x, workers=3, setup=setup, teardown=closed.append),
+    ])
+
+    with pytest.raises(RuntimeError, match="no connection"):
+        pipeline.run(range(1000))
+    assert sorted(closed) == [0, 2]
+
+
+def test_teardown_runs_when_consumer_stops_early():
+    closed = []
+    pipeline = Pipeline([
+        Stage('write', lambda conn, x: x, workers=2, setup=object, teardown=closed.append),
+    ])
+
+    stream = pipeline.stream(iter(range(10000)))
+    assert next(stream) is not None
+    stream.close()
+
+    assert len(closed) == 2
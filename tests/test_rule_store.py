@@ -0,0 +1,72 @@
+import json
+import threading
+
+from rule_store import RuleFile, load_json, match_compiled
+
+FROM_A = {"type": "from", "contains": "alpha", "label": "@A"}
+FROM_B = {"type": "from", "contains": "beta", "label": "@B"}
+SUBJECT_C = {"type": "subject", "contains": "Invoice", "label": "@C"}
+
+
+def write_rules(path, rules):
+    with open(path, 'w') as f:
+        json.dump(rules, f)
+
+
+def test_commit_replays_pending_changes_on_top_of_another_writer(tmp_path):
+    path = str(tmp_path / 'rules.json')
+    write_rules(path, [FROM_A])
+
+    ours = RuleFile(path)
+    theirs = RuleFile(path)
+
+    theirs.add(FROM_B)
+    theirs.commit()
+
+    ours.add(SUBJECT_C)
+    ours.remove(FROM_A)
+    ours.commit()
+
+    assert load_json(path) == [FROM_B, SUBJECT_C]
+
+
+def test_concurrent_commits_keep_every_change(tmp_path):
+    path = str(tmp_path / 'rules.json')
+    write_rules(path, [])
+    stores = [RuleFile(path) for _ in range(8)]
+    for i, store in enumerate(stores):
+        store.add({"type": "from", "contains": f"sender{i}", "label": "@X"})
+
+    threads = [threading.Thread(target=store.commit) for store in stores]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(r['contains'] for r in load_json(path)) == [f"sender{i}" for i in range(8)]
+
+
+def test_replace_keeps_position_and_reload_detects_outside_writes(tmp_path):
+    path = str(tmp_path / 'rules.json')
+    write_rules(path, [FROM_A, FROM_B])
+    store = RuleFile(path)
+
+    edited = dict(FROM_A, label="@A2")
+    assert store.replace(FROM_A, edited)
+    store.commit()
+    assert load_json(path) == [edited, FROM_B]
+
+    assert not store.reload_if_changed()
+    write_rules(path, [FROM_B, SUBJECT_C])
+    assert store.reload_if_changed()
+    assert store.rules() == [FROM_B, SUBJECT_C]
+
+
+def test_compiled_rules_match_first_rule_in_file_order(tmp_path):
+    path = str(tmp_path / 'rules.json')
+    write_rules(path, [SUBJECT_C, FROM_A])
+    compiled = RuleFile(path).compiled()
+
+    assert match_compiled(compiled, "Alpha <a@alpha.com>", "your invoice") == "@C"
+    assert match_compiled(compiled, "Alpha <a@alpha.com>", "hello") == "@A"
+    assert match_compiled(compiled, "someone", "hello") is None
@@ -0,0 +1,138 @@
+import json
+
+from run_journal import RunJournal, MAX_ATTEMPTS
+
+
+class FakeRequest:
+    def __init__(self, fn):
+        self.fn = fn
+
+    def execute(self):
+        return self.fn()
+
+
+class FakeGmail:
+    # Just enough of users().messages() / users().labels() for organize_inbox
+    def __init__(self, inbox, broken=()):
+        self.inbox = dict(inbox)  # msg_id -> (from, subject)
+        self.broken = set(broken)
+        self.labels_by_name = {}
+        self.inbox_scans = 0
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def labels(self):
+        return LabelsApi(self)
+
+    def list(self, userId, labelIds=None, pageToken=None, maxResults=None, q=None):
+        self.inbox_scans += 1
+        ids = sorted(self.inbox)
+        return FakeRequest(lambda: {'messages': [{'id': i} for i in ids]})
+
+    def get(self, userId, id, format=None, metadataHeaders=None):
+        sender, subject = self.inbox[id]
+        headers = [{'name': 'From', 'value': sender}, {'name': 'Subject', 'value': subject}]
+        return FakeRequest(lambda: {'payload': {'headers': headers}})
+
+    def modify(self, userId, id, body):
+        def run():
+            if id in self.broken:
+                raise IOError("modify failed")
+            self.inbox.pop(id, None)
+            return {}
+        return FakeRequest(run)
+
+
+class LabelsApi:
+    def __init__(self, gmail):
+        self.gmail = gmail
+
+    def list(self, userId):
+        labels = [{'name': n, 'id': i} for n, i in self.gmail.labels_by_name.items()]
+        return FakeRequest(lambda: {'labels': labels})
+
+    def create(self, userId, body):
+        label_id = f"Label_{len(self.gmail.labels_by_name)}"
+        self.gmail.labels_by_name[body['name']] = label_id
+        return FakeRequest(lambda: {'id': label_id})
+
+
+def test_killed_run_is_resumed_with_its_pending_actions(tmp_path):
+    db_path = str(tmp_path / 'runs.db')
+    journal = RunJournal('organize', db_path)
+    journal.plan('m1', '@A')
+    journal.plan('m2', None)
+    journal.plan('m3', '@B')
+    journal.commit('m3', '@B')
+    journal.close()
+
+    resumed = RunJournal('organize', db_path)
+    assert resumed.resumed
+    assert resumed.run_id == journal.run_id
+    assert not resumed.planning_done
+    assert all(resumed.seen(m) for m in ('m1', 'm2', 'm3'))
+    assert resumed.pending() == [('m1', '@A')]
+    resumed.close()
+
+
+def test_finished_run_hands_leftovers_to_the_next_run(tmp_path):
+    db_path = str(tmp_path / 'runs.db')
+    journal = RunJournal('organize', db_path)
+    journal.plan('m1', '@A')
+    journal.fail('m1', '@A')
+    journal.plan('m2', '@A')
+    journal.commit('m2', '@A')
+    journal.mark_planning_done()
+    journal.finish()
+    journal.close()
+
+    following = RunJournal('organize', db_path)
+    assert not following.resumed
+    assert following.run_id != journal.run_id
+    assert not following.planning_done
+    assert following.pending() == [('m1', '@A')]
+    assert not following.seen('m2')
+
+    for _ in range(MAX_ATTEMPTS - 1):
+        following.fail('m1', '@A')
+    progress = following.progress()
+    assert following.pending() == []
+    assert progress['failed'] == 1
+    following.close()
+
+
+def test_permanently_failing_apply_does_not_stop_the_next_scan(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open('rules.json', 'w') as f:
+        json.dump([{"type": "from", "contains": "news", "label": "@News"}], f)
+
+    import gmail_connect
+    monkeypatch.setattr(gmail_connect, '_rules_store', None)
+
+    gmail = FakeGmail({
+        'm1': ('news@a.com', 'hi'),
+        'm2': ('news@b.com', 'hi'),
+        'm3': ('friend@c.com', 'hi'),
+    }, broken={'m1'})
+    db_path = str(tmp_path / 'runs.db')
+
+    for run in range(MAX_ATTEMPTS):
+        if run == 1:
+            gmail.inbox['m4'] = ('news@d.com', 'new mail')
+        scans_before = gmail.inbox_scans
+        journal = RunJournal(gmail_connect.RUN_NAME, db_path)
+        progress = gmail_connect.organize_inbox(gmail, journal)
+        journal.close()
+
+        assert gmail.inbox_scans == scans_before + 1
+        assert progress['status'] == 'finished'
+
+    assert 'm4' not in gmail.inbox
+    assert sorted(gmail.inbox) == ['m1', 'm3']
+    assert progress['failed'] == 1
+    assert progress['planned'] == 0
+    assert list(gmail.labels_by_name) == ['@News']